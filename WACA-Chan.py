@@ -7,6 +7,9 @@ import webbrowser
 import requests
 import json
 import subprocess
+import socket
+import time
+import multiprocessing
 from pathlib import Path
 import logging
 
@@ -156,7 +159,8 @@ def terminal():
         "run": lambda file: os.system(f"{'python3' if os.name != 'nt' else 'python'} {file}"),
         "pshell": lambda: os.system("python3" if os.name != "nt" else "python"),
         "testimport": lambda module: __import__(module),
-        "testsystem": lambda args: startup(**parse_start_args(args), testStart=True)
+        "testsystem": lambda args: startup(**parse_start_args(args), testStart=True),
+        "resolver": run_resolver
     }
 
     while True:
@@ -183,38 +187,93 @@ def search_google(query):
 def parse_start_args(args):
     return {
         "testingMode": "-t" in args,
-        "verbose": "-v" in args
+        "verbose": "-v" in args,
+        "sharded": "-s" in args
     }
 
-def startup(testingMode=False, testStart=False, verbose=True):
+def create_bot(**shard_options):
+    import disnake
+    from disnake.ext import commands
+    import music
+    command_sync_flags = commands.CommandSyncFlags.default()
+    command_sync_flags.sync_commands_debug = True
+    # With shard options the bot only connects the shards it was given; the other processes run the rest.
+    bot_class = commands.AutoShardedBot if shard_options else commands.Bot
+    bot = bot_class(
+        command_prefix='!',
+        command_sync_flags=command_sync_flags,
+        intents=disnake.Intents.all(),
+        **shard_options
+        )
+    bot.add_cog(music.Music(bot))
+    return bot
+
+def recommended_shards(token):
+    response = requests.get("https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {token}"}, timeout=30)
+    response.raise_for_status()
+    return response.json()["shards"]
+
+def run_worker(token, shard_ids, shard_count, resolver_socket):
+    os.environ["RESOLVER_SOCKET"] = resolver_socket
+    bot = create_bot(shard_ids=shard_ids, shard_count=shard_count)
+    bot.run(token)
+
+def run_sharded(token, verbose=True):
+    # Every worker process runs its own interpreter, gateway connections and encoders, while one
+    # resolver process shares extraction results and in-flight lookups between all of them.
+    from core.resolver import run_service, service_running, DEFAULT_SOCKET
+    shard_count = recommended_shards(token)
+    # More workers than shards would leave some with no shards to run.
+    processes = min(int(os.getenv("WORKER_PROCESSES", 0)) or os.cpu_count() or 1, shard_count)
+    print(f"Running {shard_count} shard(s) in {processes} worker process(es)...")
+    context = multiprocessing.get_context("spawn")
+    resolver = None
+    if service_running(DEFAULT_SOCKET):
+        # A standalone resolver (`resolver` command) keeps its warm caches across restarts; use it.
+        print(f"Using the resolver already running on {DEFAULT_SOCKET}")
+    else:
+        resolver = context.Process(target=run_service, args=(DEFAULT_SOCKET,), name="WACA-Chan resolver", daemon=True)
+        resolver.start()
+    workers = []
+    for index in range(processes):
+        shard_ids = list(range(index, shard_count, processes))
+        if verbose:
+            print(f"Starting worker {index} with shards {shard_ids}...")
+        worker = context.Process(target=run_worker, args=(token, shard_ids, shard_count, DEFAULT_SOCKET), name=f"WACA-Chan worker {index}")
+        worker.start()
+        workers.append(worker)
+        # Discord allows one shard to identify every 5 seconds.
+        time.sleep(5 * len(shard_ids))
+    for worker in workers:
+        worker.join()
+    if resolver:
+        resolver.terminate()
+
+def run_resolver(path=None):
+    from core.resolver import run_service, DEFAULT_SOCKET
+    print("Starting the WACA-Chan resolver. Point bots at it with RESOLVER_SOCKET.")
+    run_service(path or DEFAULT_SOCKET)
+
+def startup(testingMode=False, testStart=False, verbose=True, sharded=False):
     def vprint(text):
         if verbose:
             print(text)
     print(waca_sign(testingMode))  # Print the WACA-Chan sign on startup
     print("Starting WACA-Chan...")
+    token = CONFIG["testingToken"] if testingMode else CONFIG["token"]
+    if sharded:
+        if hasattr(socket, "AF_UNIX"):
+            run_sharded(token, verbose)
+            return
+        print("Sharded mode needs Unix sockets, starting a single process instead...")
     print("Importing Modules...")
     vprint("Importing disnake...")
     import disnake
-    from disnake.ext import commands, tasks
     vprint("Importing disnake complete")
-    vprint("Importing music...")
-    import music
-    vprint("Importing music complete")
-    command_sync_flags = commands.CommandSyncFlags.default()
-    command_sync_flags.sync_commands_debug = True
     activity = disnake.Activity(name='over NETWACA', type=disnake.ActivityType.watching)
     client = disnake.Client(activity=activity)
-    bot = commands.Bot(
-        command_prefix='!',
-        command_sync_flags=command_sync_flags,
-        intents=disnake.Intents.all()
-        )
-    
-    bot.add_cog(music.Music(bot))
-    if testingMode:
-        bot.run(CONFIG["testingToken"])
-    else:
-        bot.run(CONFIG["token"])
+    bot = create_bot()
+    bot.run(token)
     print("Completed! All tasks have completed. Beginning WACA-Chan...")
     pass
 
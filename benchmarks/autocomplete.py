@@ -0,0 +1,56 @@
+"""
+/play autocomplete latency from the local title index, against Discord's 3 second
+deadline for answering an autocomplete interaction.
+
+Run from the repository root:
+
+    python -m benchmarks.autocomplete
+"""
+import random
+import time
+from core.titleindex import TitleIndex
+
+TITLES = 100_000
+QUERIES = 2_000
+WORDS = (
+    "love night the dance heart fire rain blue moon star dream city girl boy summer forever "
+    "remix live official video lyrics acoustic cover version feat radio edit extended mix"
+).split()
+
+
+def title(i):
+    return f"{' '.join(random.choice(WORDS) for _ in range(5))} #{i}"
+
+
+def queries(titles):
+    # What people type: the start of a title, as it grows, sometimes with a typo.
+    for _ in range(QUERIES):
+        text = random.choice(titles)[:random.randint(2, 24)]
+        if random.random() < 0.2 and len(text) > 4:
+            i = random.randrange(len(text))
+            text = text[:i] + text[i + 1:]
+        yield text
+
+
+def main():
+    random.seed(0)
+    titles = [title(i) for i in range(TITLES)]
+    index = TitleIndex()
+    start = time.perf_counter()
+    for i, text in enumerate(titles):
+        index.add(f"https://www.youtube.com/watch?v={i:011d}", text, 180)
+    print(f"Indexed {TITLES} titles in {time.perf_counter() - start:.1f}s")
+
+    latencies = []
+    for text in queries(titles):
+        start = time.perf_counter()
+        index.search(text)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{QUERIES} lookups: p50 {p50:.1f} ms, p99 {p99:.1f} ms, max {latencies[-1] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
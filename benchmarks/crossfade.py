@@ -0,0 +1,35 @@
+"""
+Per-frame CPU cost of the crossfade mixer, outside and inside the overlap window.
+
+Run from the repository root:
+
+    python -m benchmarks.crossfade
+"""
+import time
+import numpy as np
+from core.playback import CrossfadeMixer, SAMPLES_PER_FRAME, CHANNELS
+from benchmarks.gain import StaticSource, report
+
+FRAMES = 50000
+
+
+def main():
+    rng = np.random.default_rng(0)
+    pcm = rng.integers(-20000, 20000, SAMPLES_PER_FRAME * CHANNELS, dtype=np.int16).tobytes()
+
+    mixer = CrossfadeMixer(StaticSource(pcm), fade_frames=FRAMES)
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        mixer.read()
+    report("mixer, single track", (time.perf_counter() - start) / FRAMES)
+
+    # One fade that spans the whole run, so every frame is a blended one.
+    mixer.crossfade_to(StaticSource(pcm))
+    start = time.perf_counter()
+    for _ in range(FRAMES - 1):
+        mixer.read()
+    report("mixer, inside the overlap", (time.perf_counter() - start) / (FRAMES - 1))
+
+
+if __name__ == "__main__":
+    main()
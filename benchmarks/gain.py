@@ -0,0 +1,61 @@
+"""
+Per-stream CPU cost of the PCM gain stage against the Opus passthrough path.
+
+Run from the repository root:
+
+    python -m benchmarks.gain
+"""
+import time
+import numpy as np
+import disnake
+from core.playback import TrackedAudio, GainAudio, FRAME_LENGTH, SAMPLES_PER_FRAME, CHANNELS
+
+FRAMES = 50000
+
+
+class StaticSource(disnake.AudioSource):
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+    def cleanup(self):
+        pass
+
+
+def per_frame(source, frames=FRAMES, every=None, volumes=(0.5, 0.7)):
+    start = time.perf_counter()
+    for i in range(frames):
+        if every and i % every == 0:
+            source.original.volume = volumes[(i // every) % 2]
+        source.read()
+    return (time.perf_counter() - start) / frames
+
+
+def report(name, seconds):
+    print(f"{name:<32} {seconds * 1e6:8.2f} us/frame  {seconds / FRAME_LENGTH * 100:6.3f}% of a core per stream")
+
+
+def main():
+    rng = np.random.default_rng(0)
+    pcm = rng.integers(-20000, 20000, SAMPLES_PER_FRAME * CHANNELS, dtype=np.int16).tobytes()
+    opus_packet = rng.bytes(160)  # ~64 kbps worth of Opus per 20 ms
+
+    report("passthrough (Opus copy)", per_frame(TrackedAudio(StaticSource(opus_packet))))
+    report("gain stage at 1.0 (bypassed)", per_frame(TrackedAudio(GainAudio(StaticSource(pcm), volume=1.0))))
+    report("gain stage, steady", per_frame(TrackedAudio(GainAudio(StaticSource(pcm), volume=0.5))))
+    report("gain stage, ramp every frame", per_frame(TrackedAudio(GainAudio(StaticSource(pcm), volume=0.5)), every=1))
+
+    if disnake.opus.is_loaded() or disnake.opus._load_default():
+        encoder = disnake.opus.Encoder()
+        start = time.perf_counter()
+        for _ in range(FRAMES // 10):
+            encoder.encode(pcm, SAMPLES_PER_FRAME)
+        report("Opus encode (PCM path only)", (time.perf_counter() - start) / (FRAMES // 10))
+    else:
+        print("libopus not found, skipping the encoder cost the PCM path adds")
+
+
+if __name__ == "__main__":
+    main()
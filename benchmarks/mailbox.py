@@ -0,0 +1,79 @@
+"""
+Queue operation throughput under an interaction storm: every guild gets a burst of
+concurrent /play-style enqueues at once. Per-guild mailboxes are compared against
+serialising every guild behind one global lock.
+
+Run from the repository root:
+
+    python -m benchmarks.mailbox
+"""
+import asyncio
+import time
+from collections import deque
+from core.mailbox import Mailbox
+
+GUILDS = 200
+OPERATIONS = 250
+
+
+async def enqueue(queue, track):
+    queue.append(track)
+    # Stands in for the await a real enqueue makes (dashboard edit, starting a stream).
+    await asyncio.sleep(0)
+
+
+async def timed(operation, latencies):
+    start = time.perf_counter()
+    await operation
+    latencies.append(time.perf_counter() - start)
+
+
+def report(name, seconds, latencies):
+    latencies.sort()
+    operations = len(latencies)
+    p50 = latencies[operations // 2] * 1000
+    p99 = latencies[int(operations * 0.99)] * 1000
+    print(f"{name:<24} {operations / seconds:10.0f} ops/s  p50 {p50:8.2f} ms  p99 {p99:8.2f} ms")
+
+
+async def storm_mailboxes():
+    mailboxes = [Mailbox(f"guild {guild}") for guild in range(GUILDS)]
+    queues = [deque() for _ in range(GUILDS)]
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        timed(mailboxes[guild].submit(enqueue, queues[guild], i), latencies)
+        for i in range(OPERATIONS) for guild in range(GUILDS)
+    ))
+    elapsed = time.perf_counter() - start
+    assert all(list(queue) == list(range(OPERATIONS)) for queue in queues)
+    for mailbox in mailboxes:
+        mailbox.close()
+    return elapsed, latencies
+
+
+async def storm_global_lock():
+    lock = asyncio.Lock()
+    queues = [deque() for _ in range(GUILDS)]
+    latencies = []
+
+    async def locked(queue, track):
+        async with lock:
+            await enqueue(queue, track)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        timed(locked(queues[guild], i), latencies)
+        for i in range(OPERATIONS) for guild in range(GUILDS)
+    ))
+    return time.perf_counter() - start, latencies
+
+
+async def main():
+    print(f"{GUILDS} guilds x {OPERATIONS} concurrent enqueues")
+    report("per-guild mailboxes", *await storm_mailboxes())
+    report("one global lock", *await storm_global_lock())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
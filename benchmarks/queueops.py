@@ -0,0 +1,95 @@
+"""
+/shuffle, /dedupe and /clear on a 10k-entry queue, most of it spilled to SQLite. The
+bulk operations are compared against doing the same thing one track at a time through
+the queue's positional API, which is all the player had before.
+
+Run from the repository root:
+
+    python -m benchmarks.queueops
+"""
+import os
+import random
+import tempfile
+import time
+from core.tieredqueue import TieredQueue, QueueStore
+from core.track import Track
+
+ENTRIES = 10_000
+# Half the queue repeats a track that is already in it.
+DISTINCT = ENTRIES // 2
+# A full one-by-one shuffle takes minutes; time this many moves and scale up.
+SHUFFLE_SAMPLE = 500
+
+
+def tracks():
+    return [
+        Track(f"https://www.youtube.com/watch?v={i % DISTINCT:011d}", f"Song number {i % DISTINCT}", 180 + i % 240)
+        for i in range(ENTRIES)
+    ]
+
+
+class Transactions:
+    """Counts the write transactions a store runs."""
+
+    def __init__(self, store):
+        self.count = 0
+        store.conn.set_trace_callback(self.trace)
+
+    def trace(self, statement):
+        if statement.startswith('BEGIN'):
+            self.count += 1
+
+
+def fresh_queue(store, key):
+    queue = TieredQueue(store, key, weight=lambda track: track.duration, dump=Track.to_dict, load=Track.from_dict)
+    queue.extend(tracks())
+    return queue
+
+
+def timed(name, store, operation, queue, scale=1):
+    transactions = Transactions(store)
+    start = time.perf_counter()
+    result = operation(queue)
+    elapsed = (time.perf_counter() - start) * scale
+    print(f"{name:<32} {elapsed * 1000:10.1f} ms  {transactions.count * scale:6.0f} write batch(es)  -> {len(queue)} entries")
+    return result
+
+
+def shuffle_one_by_one(queue):
+    # The first moves of a Fisher-Yates shuffle through move(), one track at a time.
+    for i in range(len(queue) - 1, len(queue) - 1 - SHUFFLE_SAMPLE, -1):
+        queue.move(random.randint(0, i), i)
+
+
+def dedupe_one_by_one(queue):
+    seen = set()
+    position = 0
+    while position < len(queue):
+        url = queue[position].webpage_url
+        if url in seen:
+            queue.pop(position)
+        else:
+            seen.add(url)
+            position += 1
+
+
+def clear_one_by_one(queue):
+    while queue:
+        queue.pop()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        store = QueueStore(os.path.join(directory, 'queue_spill.db'))
+        print(f"{ENTRIES} entries, {DISTINCT} distinct")
+        timed("shuffle", store, lambda queue: queue.shuffle(), fresh_queue(store, 'bulk shuffle'))
+        timed("shuffle, one by one (projected)", store, shuffle_one_by_one, fresh_queue(store, 'single shuffle'), ENTRIES / SHUFFLE_SAMPLE)
+        timed("dedupe", store, lambda queue: queue.dedupe(lambda track: track.webpage_url), fresh_queue(store, 'bulk dedupe'))
+        timed("dedupe, one by one", store, dedupe_one_by_one, fresh_queue(store, 'single dedupe'))
+        timed("clear", store, lambda queue: queue.clear(), fresh_queue(store, 'bulk clear'))
+        timed("clear, one by one", store, clear_one_by_one, fresh_queue(store, 'single clear'))
+        store.conn.close()
+
+
+if __name__ == '__main__':
+    main()
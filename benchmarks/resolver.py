@@ -0,0 +1,74 @@
+"""
+Request throughput of the resolver daemon's IPC protocol: one request per round trip,
+many requests in flight on one connection, and batched requests. Every lookup is a
+cache hit, so this measures the protocol and the service loop, not yt-dlp.
+
+Run from the repository root:
+
+    python -m benchmarks.resolver
+"""
+import asyncio
+import os
+import tempfile
+import time
+from core.resolver import ResolverService, ResolverClient
+
+TRACKS = 1000
+REQUESTS = 20000
+BATCH = 50
+
+
+def warm(service):
+    # Far-future entries, as if every track had been extracted once already.
+    for i in range(TRACKS):
+        url = f"https://www.youtube.com/watch?v={i:011d}"
+        service.cache[('extract', url)] = (time.time() + 3600, {
+            'url': f"https://rr1---sn.googlevideo.com/videoplayback?expire={int(time.time()) + 21600}&id={i}",
+            'title': f"Track {i}",
+            'duration': 180 + i % 120,
+            'thumbnail': f"https://i.ytimg.com/vi/{i:011d}/hqdefault.jpg",
+            'webpage_url': url,
+            'abr': 128
+        })
+
+
+def report(name, seconds, requests=REQUESTS):
+    print(f"{name:<32} {requests / seconds:10.0f} requests/s  {seconds / requests * 1e6:8.1f} us/request")
+
+
+async def main():
+    path = os.path.join(tempfile.mkdtemp(), 'resolver.sock')
+    service = ResolverService(path)
+    warm(service)
+    server = asyncio.create_task(service.serve())
+    while not os.path.exists(path):
+        await asyncio.sleep(0.01)
+
+    client = ResolverClient(path)
+    urls = [f"https://www.youtube.com/watch?v={i % TRACKS:011d}" for i in range(REQUESTS)]
+
+    start = time.perf_counter()
+    for url in urls:
+        await client.extract(url)
+    report("sequential", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, REQUESTS, BATCH):
+        await asyncio.gather(*(client.extract(url) for url in urls[i:i + BATCH]))
+    report(f"{BATCH} in flight", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, REQUESTS, BATCH):
+        await client.extract_many(urls[i:i + BATCH])
+    report(f"batches of {BATCH}", time.perf_counter() - start)
+
+    stats = await client.request('stats')
+    print(f"{stats['hits']} hits, {stats['misses']} misses")
+    client.writer.close()
+    await asyncio.sleep(0.1)
+    server.cancel()
+    await asyncio.gather(server, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+Memory held by a 100k-track queue: the per-track dicts the player used to queue against
+slotted Track records, which keep a stream URL only for the entries near the head.
+
+Run from the repository root:
+
+    python -m benchmarks.tracks
+"""
+import gc
+import time
+import tracemalloc
+from core.streamurl import parse_expiry
+from core.track import Track, STREAM_WINDOW
+from core.trackqueue import TrackQueue
+
+TRACKS = 100_000
+# Distinct videos; big queues are mostly the same playlists queued again.
+VIDEOS = 20_000
+# A signed googlevideo URL is around a kilobyte.
+STREAM_PADDING = 'x' * 900
+
+
+def info(i):
+    video = i % VIDEOS
+    expires = int(time.time()) + 6 * 3600
+    return {
+        'url': f"https://rr{i % 8}---sn-abc.googlevideo.com/videoplayback?expire={expires}&id={i}&sig={STREAM_PADDING}",
+        'title': f"Artist {video % 500} - Song number {video}",
+        'duration': str(180 + video % 240),
+        'thumbnail': f"https://i.ytimg.com/vi/{video:011d}/hqdefault.jpg",
+        # Every resolve returns a fresh string, even for a video seen before.
+        'webpage_url': ''.join(['https://www.youtube.com/watch?v=', f"{video:011d}"]),
+        'abr': 129.5,
+    }
+
+
+def as_dict(i):
+    values = info(i)
+    return {
+        'url': values['url'],
+        'title': values['title'],
+        'duration': int(values['duration']),
+        'thumbnail': values['thumbnail'],
+        'webpage_url': values['webpage_url'],
+        'abr': values['abr'],
+        'expires': parse_expiry(values['url']),
+    }
+
+
+def as_track(i, keep_stream):
+    values = info(i)
+    track = Track.from_info(values, values['webpage_url'])
+    if not keep_stream(i):
+        track.release_stream()
+    return track
+
+
+def measure(name, build):
+    gc.collect()
+    tracemalloc.start()
+    queue = TrackQueue(build(i) for i in range(TRACKS))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<28} {current / 1048576:8.1f} MB  {current / len(queue):8.0f} B/track")
+    return current
+
+
+def main():
+    print(f"{TRACKS} queued tracks, {VIDEOS} distinct videos")
+    dicts = measure("dict", as_dict)
+    measure("Track, every stream kept", lambda i: as_track(i, lambda i: True))
+    tracks = measure(f"Track, first {STREAM_WINDOW} streams", lambda i: as_track(i, lambda i: i < STREAM_WINDOW))
+    print(f"{dicts / tracks:.1f}x less memory")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import asyncio
+import re
+from collections import deque
+import numpy as np
+from typing import Optional
+from core.supervisor import supervisor
+
+# Loudness everything is normalized to, in LUFS. Matches what YouTube and Spotify target.
+TARGET_LOUDNESS = -14.0
+
+# Never boost or cut by more than this, so near-silent or clipped uploads don't go wild.
+MAX_BOOST_DB = 6.0
+MAX_CUT_DB = 12.0
+
+# Silence detection runs on a cheap mono 8 kHz downmix in 50 ms windows.
+ANALYSIS_RATE = 8000
+WINDOW = ANALYSIS_RATE // 20
+
+# Windows quieter than this (RMS, dBFS) count as dead air.
+SILENCE_THRESHOLD_DB = -50.0
+
+# Edges shorter than this aren't worth an -ss/-t, and the tail keeps a little room for reverb.
+MIN_TRIM = 0.5
+TAIL_PADDING = 0.3
+
+# Only the end of FFmpeg's log is kept; the loudness summary is its last dozen lines or so.
+STDERR_LINES = 64
+
+_INTEGRATED = re.compile(r'I:\s+(-?\d+(?:\.\d+)?) LUFS')
+_SILENCE_RMS = 32768 * 10 ** (SILENCE_THRESHOLD_DB / 20)
+
+
+async def analyse_stream(url: str, executable: str = "ffmpeg", guild_id: Optional[int] = None) -> Optional[dict]:
+    """
+    Decodes a stream once and measures everything playback needs to know about it up front:
+    its integrated loudness (FFmpeg's EBU R128 filter) and where the real audio starts and ends
+    (RMS over the decoded PCM). The PCM is processed as it arrives, so memory stays flat
+    no matter how long the track is.
+
+    Args:
+        url (str): The stream URL to analyse.
+        executable (str, optional): The FFmpeg executable. Defaults to "ffmpeg".
+        guild_id (Optional[int]): The guild the analysis is for, for process accounting.
+
+    Returns:
+        Optional[dict]: 'loudness' in LUFS (None for silence), and 'trim_start'/'trim_end' in seconds,
+        or None if the stream could not be decoded.
+    """
+    await supervisor.admit(background=True)
+    # Per-frame measurements are logged at verbose level, which -loglevel info leaves out; only the summary is printed.
+    process = await asyncio.create_subprocess_exec(
+        executable, '-hide_banner', '-nostats', '-loglevel', 'info',
+        '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+        '-i', url, '-vn', '-af', 'ebur128=framelog=verbose',
+        '-ac', '1', '-ar', str(ANALYSIS_RATE), '-f', 's16le', 'pipe:1',
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    supervisor.register(process.pid, 'analysis', guild_id)
+    stderr_lines = deque(maxlen=STDERR_LINES)
+
+    async def drain_stderr():
+        # Keeps the pipe flowing without holding on to more than the tail of the log.
+        async for line in process.stderr:
+            stderr_lines.append(line)
+
+    stderr_task = asyncio.create_task(drain_stderr())
+    window_bytes = WINDOW * 2
+    pending = b''
+    windows = 0
+    first_loud = last_loud = None
+    try:
+        while True:
+            chunk = await process.stdout.read(window_bytes * 256)
+            if not chunk:
+                break
+            pending += chunk
+            usable = len(pending) - len(pending) % window_bytes
+            if not usable:
+                continue
+            samples = np.frombuffer(pending[:usable], dtype=np.int16).astype(np.float32).reshape(-1, WINDOW)
+            pending = pending[usable:]
+            loud = np.flatnonzero(np.sqrt(np.mean(samples * samples, axis=1)) > _SILENCE_RMS)
+            if loud.size:
+                if first_loud is None:
+                    first_loud = windows + int(loud[0])
+                last_loud = windows + int(loud[-1])
+            windows += samples.shape[0]
+        await stderr_task
+        await process.wait()
+    finally:
+        # Cancelled or failed halfway: don't leave FFmpeg decoding into a pipe nobody reads.
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        stderr_task.cancel()
+
+    stderr = b''.join(stderr_lines).decode(errors='ignore')
+    if process.returncode != 0 or not windows:
+        return None
+
+    # The summary is printed last; any earlier match would be a per-frame value.
+    matches = _INTEGRATED.findall(stderr)
+    loudness = float(matches[-1]) if matches else None
+    # Digital silence measures as -70 LUFS; there's nothing sensible to normalize there.
+    if loudness is not None and loudness <= -70.0:
+        loudness = None
+
+    length = windows * WINDOW / ANALYSIS_RATE
+    trim_start, trim_end = 0.0, length
+    if first_loud is not None:
+        start = first_loud * WINDOW / ANALYSIS_RATE
+        end = min(length, (last_loud + 1) * WINDOW / ANALYSIS_RATE + TAIL_PADDING)
+        if start >= MIN_TRIM:
+            trim_start = start
+        if length - end >= MIN_TRIM:
+            trim_end = end
+    return {'loudness': loudness, 'trim_start': trim_start, 'trim_end': trim_end}
+
+
+def loudness_gain(loudness: Optional[float]) -> float:
+    """
+    Converts a measured loudness into the linear gain that brings it to TARGET_LOUDNESS.
+
+    Args:
+        loudness (Optional[float]): The integrated loudness in LUFS, if known.
+
+    Returns:
+        float: The gain to multiply samples with, 1.0 if the loudness is unknown.
+    """
+    if loudness is None:
+        return 1.0
+    gain_db = min(MAX_BOOST_DB, max(-MAX_CUT_DB, TARGET_LOUDNESS - loudness))
+    return 10 ** (gain_db / 20)
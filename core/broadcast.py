@@ -0,0 +1,158 @@
+import threading
+import disnake
+from typing import Callable, Hashable
+from core.playback import FRAME_LENGTH, SAMPLES_PER_FRAME
+from core.encoding import policy
+
+# Players that start the same track within this many seconds of each other share one pipeline.
+JOIN_WINDOW = 3.0
+
+
+class Broadcast:
+    """
+    One decode (and, for PCM sources, one Opus encode) of a track, fanned out to every
+    subscriber as Opus packets. There is no feeder thread: whichever subscriber is furthest
+    ahead pulls the next packet from the source, and packets are dropped once every
+    subscriber has read them.
+
+    Args:
+        source (disnake.AudioSource): The source to share, Opus or PCM.
+        bitrate (int): The bitrate in kbps PCM sources get encoded at.
+    """
+
+    def __init__(self, source: disnake.AudioSource, bitrate: int):
+        self.source = source
+        self.encoder = None
+        if not source.is_opus():
+            self.encoder = disnake.opus.Encoder()
+            policy.configure(self.encoder, bitrate)
+        self.packets = []
+        self.base = 0
+        self.positions = {}
+        self.ended = False
+        self.closed = False
+        self.window_frames = int(JOIN_WINDOW / FRAME_LENGTH)
+        self.lock = threading.Lock()
+        self.read_lock = threading.Lock()
+
+    @property
+    def produced(self) -> int:
+        return self.base + len(self.packets)
+
+    def joinable(self) -> bool:
+        """Checks whether a new subscriber can still hear this broadcast from the start."""
+        return not self.ended and self.base == 0 and self.produced <= self.window_frames
+
+    def subscribe(self) -> 'BroadcastSubscriber':
+        subscriber = BroadcastSubscriber(self)
+        with self.lock:
+            self.positions[subscriber] = 0
+        return subscriber
+
+    def unsubscribe(self, subscriber: 'BroadcastSubscriber') -> bool:
+        """Removes a subscriber; returns True (and stops the source) if it was the last one."""
+        with self.lock:
+            self.positions.pop(subscriber, None)
+            last = not self.positions
+        if last:
+            self.ended = self.closed = True
+            self.source.cleanup()
+        return last
+
+    def read(self, subscriber: 'BroadcastSubscriber') -> bytes:
+        index = self.positions.get(subscriber)
+        if index is None:
+            return b''
+        if index >= self.produced:
+            # Only the subscriber at the front ever waits on the source; the rest read from the buffer.
+            with self.read_lock:
+                while index >= self.produced and not self.ended:
+                    data = self.source.read()
+                    if not data:
+                        self.ended = True
+                        break
+                    if self.encoder:
+                        data = self.encoder.encode(data, SAMPLES_PER_FRAME)
+                    with self.lock:
+                        self.packets.append(data)
+        with self.lock:
+            if index >= self.produced:
+                return b''
+            data = self.packets[index - self.base]
+            self.positions[subscriber] = index + 1
+            # Late joiners start from the first packet, so keep everything until the join window closes.
+            if self.produced > self.window_frames:
+                oldest = min(self.positions.values())
+                if oldest > self.base:
+                    del self.packets[:oldest - self.base]
+                    self.base = oldest
+        return data
+
+
+class BroadcastSubscriber(disnake.AudioSource):
+    """One voice client's view of a Broadcast."""
+
+    def __init__(self, broadcast: Broadcast):
+        self.broadcast = broadcast
+        self.hub = None
+
+    def read(self) -> bytes:
+        return self.broadcast.read(self)
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self) -> None:
+        if self.broadcast.unsubscribe(self) and self.hub:
+            self.hub.release(self.broadcast)
+
+
+class BroadcastHub:
+    """Keeps track of the running broadcasts so players starting the same track can find each other."""
+
+    def __init__(self):
+        self.broadcasts = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, key: Hashable, factory: Callable[[], disnake.AudioSource], bitrate: int) -> BroadcastSubscriber:
+        """
+        Joins the broadcast of `key` if one started recently enough, or starts a new one.
+
+        Args:
+            key (Hashable): Identifies the track, the part of it being played and how it's encoded.
+            factory (Callable[[], disnake.AudioSource]): Creates the source when a new broadcast is needed.
+            bitrate (int): The bitrate in kbps a new broadcast encodes PCM at.
+
+        Returns:
+            BroadcastSubscriber: The source to hand to the voice client.
+        """
+        with self.lock:
+            broadcast = self.broadcasts.get(key)
+            if broadcast is None or not broadcast.joinable():
+                broadcast = Broadcast(factory(), bitrate)
+                self.broadcasts[key] = broadcast
+            subscriber = broadcast.subscribe()
+            subscriber.hub = self
+        return subscriber
+
+    def joinable(self, key: Hashable) -> bool:
+        """Checks whether subscribing to `key` right now would join an existing broadcast."""
+        with self.lock:
+            broadcast = self.broadcasts.get(key)
+            return broadcast is not None and broadcast.joinable()
+
+    def release(self, broadcast: Broadcast) -> None:
+        with self.lock:
+            for key, value in list(self.broadcasts.items()):
+                if value is broadcast:
+                    del self.broadcasts[key]
+
+    def stats(self) -> tuple:
+        """Returns how many broadcasts are running and how many voice clients they feed."""
+        with self.lock:
+            broadcasts = list(self.broadcasts.values())
+        return len(broadcasts), sum(len(broadcast.positions) for broadcast in broadcasts)
+
+
+# Shared by every player in the process.
+hub = BroadcastHub()
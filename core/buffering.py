@@ -0,0 +1,187 @@
+import asyncio
+import os
+import sys
+import tempfile
+import aiohttp
+import psutil
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Stream buffers may use this share of the memory that is currently available, up to a hard cap.
+BUDGET_FRACTION = 0.05
+MAX_TOTAL_BUDGET = 512 * 1024 * 1024
+
+# Per-stream bounds. The minimum is the kernel's default pipe size, so we never shrink below it.
+MIN_STREAM_BUFFER = 64 * 1024
+MAX_STREAM_BUFFER = 4 * 1024 * 1024
+
+# Streams on a flaky connection get this much more read-ahead.
+UNHEALTHY_FACTOR = 2
+
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+PIPE_MAX_SIZE_FILE = '/proc/sys/fs/pipe-max-size'
+
+# Chunk size for progressive downloads.
+DOWNLOAD_CHUNK = 256 * 1024
+
+# A progressive download gives up once the server has sent nothing for this long (seconds). There is
+# no limit on the download as a whole, since it runs as long as the track plays.
+DOWNLOAD_READ_TIMEOUT = 30
+
+
+def find_ffmpeg_processes(source) -> list:
+    """
+    Finds the FFmpeg processes behind a (possibly wrapped) audio source.
+
+    Args:
+        source: A disnake.AudioSource, optionally wrapped in TrackedAudio, GainAudio, a CrossfadeMixer or a broadcast.
+
+    Returns:
+        list: The subprocess.Popen objects found.
+    """
+    processes = []
+    pending = [source]
+    while pending:
+        source = pending.pop()
+        if source is None:
+            continue
+        process = getattr(source, '_process', None)
+        if process:
+            processes.append(process)
+        broadcast = getattr(source, 'broadcast', None)
+        pending.extend((
+            getattr(source, 'original', None),
+            getattr(source, 'current', None),
+            getattr(source, 'incoming', None),
+            broadcast.source if broadcast else None,
+        ))
+    return processes
+
+
+class BufferBudget:
+    """
+    Splits a global read-ahead budget between all running streams. The read-ahead is the
+    pipe FFmpeg writes into: its capacity is kernel memory that lets FFmpeg keep reading
+    ahead of playback, so a stream rides out network hiccups as long as it has data buffered there.
+    """
+
+    def __init__(self):
+        self.processes = []
+        self.pipe_max_size = self._read_pipe_max_size()
+
+    @staticmethod
+    def _read_pipe_max_size() -> int:
+        try:
+            with open(PIPE_MAX_SIZE_FILE) as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return MAX_STREAM_BUFFER
+
+    @property
+    def active(self) -> int:
+        self.processes = [process for process in self.processes if process.poll() is None]
+        return len(self.processes)
+
+    def stream_buffer_size(self, unhealthy: bool = False) -> int:
+        """
+        Sizes the buffer of a new stream from available memory and the streams already running.
+
+        Args:
+            unhealthy (bool, optional): Whether the network has been dropping streams lately. Defaults to False.
+
+        Returns:
+            int: The buffer size in bytes.
+        """
+        budget = min(MAX_TOTAL_BUDGET, psutil.virtual_memory().available * BUDGET_FRACTION)
+        size = budget / (self.active + 1)
+        if unhealthy:
+            size *= UNHEALTHY_FACTOR
+        return int(max(MIN_STREAM_BUFFER, min(MAX_STREAM_BUFFER, self.pipe_max_size, size)))
+
+    def apply(self, source, unhealthy: bool = False) -> Optional[int]:
+        """
+        Resizes the output pipes of a source's FFmpeg processes to their share of the budget.
+
+        Args:
+            source: The audio source that was just created.
+            unhealthy (bool, optional): Whether the network has been dropping streams lately. Defaults to False.
+
+        Returns:
+            Optional[int]: The buffer size applied, or None where pipes can't be resized.
+        """
+        if fcntl is None or not sys.platform.startswith('linux'):
+            return None
+        size = None
+        for process in find_ffmpeg_processes(source):
+            if process in self.processes or not process.stdout:
+                continue
+            size = self.stream_buffer_size(unhealthy)
+            try:
+                fcntl.fcntl(process.stdout.fileno(), F_SETPIPE_SZ, size)
+            except OSError as e:
+                print(f"Couldn't resize FFmpeg pipe to {size} bytes: {e}")
+                size = None
+            self.processes.append(process)
+        return size
+
+
+class ProgressiveDownload:
+    """
+    Downloads a stream into a temporary file while it plays, so read-ahead lives on disk
+    instead of in memory. FFmpeg follows the file as it grows.
+
+    Args:
+        url (str): The stream URL to download.
+    """
+
+    # Keep reading at the end of the file while it is still being written, and give up
+    # once it has stopped growing for a few seconds.
+    before_options = '-follow 1 -rw_timeout 3000000'
+
+    def __init__(self, url: str):
+        self.url = url
+        fd, self.path = tempfile.mkstemp(prefix='waca-', suffix='.audio')
+        os.close(fd)
+        self.loop = None
+        self.task = None
+        self.downloaded = 0
+
+    @property
+    def input(self) -> str:
+        return f'file:{self.path}'
+
+    def start(self) -> None:
+        self.loop = asyncio.get_event_loop()
+        self.task = self.loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=DOWNLOAD_READ_TIMEOUT)) as session:
+                async with session.get(self.url) as response:
+                    response.raise_for_status()
+                    with open(self.path, 'wb') as file:
+                        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK):
+                            file.write(chunk)
+                            file.flush()
+                            self.downloaded += len(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Progressive download failed after {self.downloaded} bytes: {e}")
+
+    def close(self) -> None:
+        # Usually called from the voice player's thread when the source is cleaned up.
+        if self.task:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+# Shared by every player in the process.
+budget = BufferBudget()
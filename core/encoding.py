@@ -0,0 +1,75 @@
+import disnake
+
+# Discord's default voice channel bitrate, used when a channel doesn't report one.
+DEFAULT_BITRATE = 64
+
+# libopus' valid range, in kbps.
+MIN_BITRATE = 8
+MAX_BITRATE = 510
+
+# An Opus source this much above the channel's bitrate is still passed through untouched;
+# re-encoding it would cost more CPU than the bandwidth is worth.
+COPY_TOLERANCE = 1.25
+
+# libopus complexity (0-10): the default, and what we drop to while the host is saturated.
+NORMAL_COMPLEXITY = 10
+PRESSURE_COMPLEXITY = 3
+
+_OPUS_SET_COMPLEXITY = 4010
+
+
+class EncoderPolicy:
+    """
+    Decides how every stream gets encoded: at the bitrate its voice channel can actually carry,
+    and with less effort while the host is short on CPU.
+    """
+
+    def __init__(self):
+        # Set by the load governor, which samples the host for everyone.
+        self.under_pressure = False
+
+    @property
+    def complexity(self) -> int:
+        return PRESSURE_COMPLEXITY if self.under_pressure else NORMAL_COMPLEXITY
+
+    def bitrate_for(self, channel) -> int:
+        """
+        Picks the encoding bitrate for a voice channel.
+
+        Args:
+            channel: The connected voice or stage channel, if any.
+
+        Returns:
+            int: The bitrate in kbps.
+        """
+        bitrate = getattr(channel, 'bitrate', None)
+        kbps = bitrate // 1000 if bitrate else DEFAULT_BITRATE
+        return max(MIN_BITRATE, min(MAX_BITRATE, kbps))
+
+    def opus_output(self, codec: str, source_kbps, bitrate: int) -> tuple:
+        """
+        Chooses between passing an Opus source through and re-encoding it for FFmpegOpusAudio.
+
+        Args:
+            codec (str): The probed source codec.
+            source_kbps: The source's audio bitrate in kbps, if known.
+            bitrate (int): The target bitrate in kbps.
+
+        Returns:
+            tuple: The codec argument for FFmpegOpusAudio (None re-encodes) and extra FFmpeg output options.
+        """
+        if codec in ('opus', 'libopus') and (self.under_pressure or not source_kbps or source_kbps <= bitrate * COPY_TOLERANCE):
+            return codec, ''
+        return None, f'-compression_level {self.complexity}'
+
+    def configure(self, encoder: disnake.opus.Encoder, bitrate: int) -> None:
+        """Applies the bitrate and current complexity to one of disnake's Opus encoders."""
+        if not encoder:
+            return
+        encoder.set_bitrate(bitrate)
+        # disnake has no setter for complexity, so go through the same ctl call its other setters use.
+        disnake.opus._lib.opus_encoder_ctl(encoder._state, _OPUS_SET_COMPLEXITY, self.complexity)
+
+
+# Shared by every player in the process.
+policy = EncoderPolicy()
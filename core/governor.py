@@ -0,0 +1,96 @@
+import asyncio
+import time
+import psutil
+from core.encoding import policy as encoding
+
+# Entering degraded mode: any one of these is enough.
+CPU_HIGH = 85.0
+MEMORY_HIGH = 90.0
+LAG_HIGH = 0.25
+
+# Leaving it: all of these have to hold.
+CPU_LOW = 65.0
+MEMORY_LOW = 80.0
+LAG_LOW = 0.1
+
+# Once degraded, stay degraded at least this long so we don't flap every sample.
+MIN_DEGRADED = 30.0
+
+# How often the event loop lag probe wakes up.
+LAG_PROBE_INTERVAL = 0.5
+
+
+class LoadGovernor:
+    """
+    Watches host CPU, memory and event loop lag, and switches the bot into a degraded mode
+    while the host is saturated: background playlist ingestion waits, encoders work less,
+    and no new voice sessions are started. Listeners who are already connected keep
+    stable audio; everyone else is told when to expect things to be back to normal.
+    """
+
+    def __init__(self):
+        self.cpu = 0.0
+        self.memory = 0.0
+        self.lag = 0.0
+        self._max_lag = 0.0
+        self.degraded = False
+        self.degraded_since = None
+        # Running average of how long degraded periods last, for the ETA we give users.
+        self.average_episode = 60.0
+        self.calm = asyncio.Event()
+        self.calm.set()
+
+    async def probe_lag(self) -> None:
+        """Measures how late the event loop wakes up; runs for the lifetime of the bot."""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self._max_lag = max(self._max_lag, time.monotonic() - started - LAG_PROBE_INTERVAL)
+
+    def sample(self) -> bool:
+        """
+        Samples the host and updates degraded mode.
+
+        Returns:
+            bool: True if degraded mode was entered or left.
+        """
+        self.cpu = psutil.cpu_percent(interval=None)
+        self.memory = psutil.virtual_memory().percent
+        self.lag, self._max_lag = self._max_lag, 0.0
+
+        now = time.monotonic()
+        was_degraded = self.degraded
+        if self.cpu >= CPU_HIGH or self.memory >= MEMORY_HIGH or self.lag >= LAG_HIGH:
+            if not self.degraded:
+                self.degraded_since = now
+            self.degraded = True
+        elif self.degraded and now - self.degraded_since >= MIN_DEGRADED \
+                and self.cpu <= CPU_LOW and self.memory <= MEMORY_LOW and self.lag <= LAG_LOW:
+            self.average_episode = 0.7 * self.average_episode + 0.3 * (now - self.degraded_since)
+            self.degraded = False
+            self.degraded_since = None
+
+        if self.degraded:
+            self.calm.clear()
+        else:
+            self.calm.set()
+        encoding.under_pressure = self.degraded
+        return was_degraded != self.degraded
+
+    def eta(self) -> float:
+        """Estimates how many seconds until degraded mode ends, 0 if it isn't active."""
+        if not self.degraded:
+            return 0.0
+        elapsed = time.monotonic() - self.degraded_since
+        return max(MIN_DEGRADED - elapsed, self.average_episode - elapsed, 10.0)
+
+    async def wait_until_calm(self) -> None:
+        """Blocks deferrable work while the host is saturated."""
+        await self.calm.wait()
+
+    def describe(self) -> str:
+        return f"CPU {self.cpu:.0f}%, memory {self.memory:.0f}%, loop lag {self.lag * 1000:.0f} ms"
+
+
+# Shared by every player in the process.
+governor = LoadGovernor()
@@ -0,0 +1,75 @@
+import asyncio
+
+
+class Mailbox:
+    """
+    Runs the coroutines posted to it one at a time, in the order they were posted, on a
+    single consumer task. Whatever only the consumer touches needs no locks, and two
+    mailboxes never wait on each other.
+
+    Never submit to a mailbox from work that is already running on it: the outer call
+    would wait for the inner one, which waits for the outer one to finish.
+
+    Args:
+        name (str, optional): Shown in errors and task names.
+    """
+
+    def __init__(self, name: str = "mailbox"):
+        self.name = name
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.busy = False
+        self.processed = 0
+
+    @property
+    def idle(self) -> bool:
+        return not self.busy and self.queue.empty()
+
+    def post(self, func, *args, **kwargs) -> asyncio.Future:
+        """
+        Queues func(*args, **kwargs) without waiting for it.
+
+        Returns:
+            asyncio.Future: Resolves to the coroutine's result or exception.
+        """
+        future = asyncio.get_event_loop().create_future()
+        self.queue.put_nowait((func, args, kwargs, future))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run(), name=f"{self.name} consumer")
+        return future
+
+    async def submit(self, func, *args, **kwargs):
+        """Queues func(*args, **kwargs) and waits for its result; exceptions are raised here."""
+        return await self.post(func, *args, **kwargs)
+
+    async def _run(self) -> None:
+        while True:
+            func, args, kwargs, future = await self.queue.get()
+            if future.cancelled():
+                continue
+            self.busy = True
+            try:
+                result = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                else:
+                    print(f"Error in {self.name}: {e}")
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.busy = False
+                self.processed += 1
+
+    def close(self) -> None:
+        """Stops the consumer; anything still queued is cancelled."""
+        if self.task:
+            self.task.cancel()
+        while not self.queue.empty():
+            *_, future = self.queue.get_nowait()
+            future.cancel()
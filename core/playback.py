@@ -0,0 +1,207 @@
+import time
+import disnake
+from typing import Callable, Optional
+import numpy as np
+
+# Discord voice runs on 20 ms Opus frames; every read() hands over exactly one.
+FRAME_LENGTH = 0.02
+
+# A source that hasn't produced a frame for this long is considered stalled.
+STALL_TIMEOUT = 8.0
+
+# A track that ends more than this many seconds before its duration ended early.
+EOF_TOLERANCE = 5.0
+
+# 48 kHz stereo s16le, as produced by FFmpegPCMAudio: 960 samples per channel per frame.
+SAMPLES_PER_FRAME = disnake.opus.Encoder.SAMPLES_PER_FRAME
+CHANNELS = disnake.opus.Encoder.CHANNELS
+
+# Gain changes are spread linearly across one frame so they don't click.
+_RAMP = np.linspace(0.0, 1.0, SAMPLES_PER_FRAME, endpoint=False, dtype=np.float32)[:, None]
+
+# How long before a crossfade the next track's decoder is spawned, to cover FFmpeg's startup.
+CROSSFADE_LEAD = 2.0
+
+# Recovery gives up after this many attempts of at most RECOVERY_TIMEOUT seconds each.
+RECOVERY_ATTEMPTS = 3
+RECOVERY_TIMEOUT = 15.0
+
+
+class TrackedAudio(disnake.AudioSource):
+    """
+    Wraps an audio source and counts the frames delivered to the voice client,
+    which gives the exact playback position and lets a watchdog notice stalls.
+
+    Args:
+        original (disnake.AudioSource): The source to wrap.
+        start (float, optional): The position in seconds the source starts at. Defaults to 0.
+        on_cleanup (Optional[Callable[[], None]]): Called after the source is cleaned up, to release anything tied to it.
+    """
+
+    def __init__(self, original: disnake.AudioSource, start: float = 0.0, on_cleanup: Optional[Callable[[], None]] = None):
+        self.original = original
+        self.start = start
+        self.on_cleanup = on_cleanup
+        self.closed = False
+        self.frames = 0
+        self.ended = False
+        self.last_frame_at = time.monotonic()
+
+    @property
+    def position(self) -> float:
+        """The playback position in seconds."""
+        return self.start + self.frames * FRAME_LENGTH
+
+    def read(self) -> bytes:
+        data = self.original.read()
+        if data:
+            self.frames += 1
+            self.last_frame_at = time.monotonic()
+        else:
+            self.ended = True
+        return data
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self) -> None:
+        self.closed = True
+        self.original.cleanup()
+        if self.on_cleanup:
+            self.on_cleanup()
+            self.on_cleanup = None
+
+    def reset_stall_timer(self) -> None:
+        """Restarts the stall timer, e.g. after the player was paused."""
+        self.last_frame_at = time.monotonic()
+
+    def stalled(self) -> bool:
+        """Checks whether the source has stopped producing frames while still playing."""
+        return not self.ended and time.monotonic() - self.last_frame_at > STALL_TIMEOUT
+
+    def ended_early(self, duration: float) -> bool:
+        """Checks whether the source ran dry well before the end of a track of `duration` seconds."""
+        return self.ended and duration > 0 and self.position < duration - EOF_TOLERANCE
+
+
+class GainAudio(disnake.AudioSource):
+    """
+    Applies a gain to a PCM source, one 20 ms frame at a time. Unlike the Opus
+    passthrough path the volume can change at any moment without respawning FFmpeg;
+    the change is ramped over a single frame to avoid clicks.
+
+    Args:
+        original (disnake.AudioSource): A PCM source, usually disnake.FFmpegPCMAudio.
+        volume (float, optional): The user's volume, 1.0 being unchanged. Defaults to 1.0.
+        normalization (float, optional): A constant per-track gain applied on top. Defaults to 1.0.
+    """
+
+    def __init__(self, original: disnake.AudioSource, volume: float = 1.0, normalization: float = 1.0):
+        self.original = original
+        self.volume = volume
+        self.normalization = normalization
+        self._applied = volume * normalization
+
+    def read(self) -> bytes:
+        data = self.original.read()
+        if not data:
+            return data
+        target = self.volume * self.normalization
+        current = self._applied
+        if target == current == 1.0:
+            return data
+
+        samples = np.frombuffer(data, dtype=np.int16).reshape(-1, CHANNELS)
+        if target == current:
+            scaled = samples * np.float32(target)
+        else:
+            scaled = samples * (current + (target - current) * _RAMP)
+            self._applied = target
+        return np.clip(scaled, -32768, 32767).astype(np.int16).tobytes()
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        self.original.cleanup()
+
+
+class CrossfadeMixer(disnake.AudioSource):
+    """
+    Plays PCM sources back to back, blending the end of one into the start of the next
+    with an equal-power curve. The next source is only read, and only needs to exist,
+    for the overlap window; once the fade completes the old source is cleaned up.
+
+    Args:
+        current (disnake.AudioSource): The PCM source to start with.
+        fade_frames (int): The length of the overlap in 20 ms frames.
+    """
+
+    def __init__(self, current: disnake.AudioSource, fade_frames: int):
+        self.current = current
+        self.incoming = None
+        self.fade_frames = max(1, fade_frames)
+        self._delay = 0
+        self._faded = 0
+        self._current_done = False
+
+    def crossfade_to(self, source: disnake.AudioSource, delay_frames: int = 0) -> None:
+        """
+        Schedules the fade into `source`.
+
+        Args:
+            source (disnake.AudioSource): The next PCM source.
+            delay_frames (int, optional): How many more frames of the current source to play before fading. Defaults to 0.
+        """
+        self._delay = max(0, delay_frames)
+        self._faded = 0
+        self._current_done = False
+        self.incoming = source
+
+    def read(self) -> bytes:
+        incoming = self.incoming
+        if incoming is None:
+            return self.current.read()
+
+        if self._delay > 0:
+            data = self.current.read()
+            if data:
+                self._delay -= 1
+                return data
+            # The current track ran out before the fade point; go straight to the next one.
+            self._delay = 0
+            self._current_done = True
+
+        outgoing = b'' if self._current_done else self.current.read()
+        if not outgoing:
+            self._current_done = True
+        data = incoming.read()
+        if not data:
+            # The next track failed to start; finish what's left of this one instead.
+            self.incoming = None
+            incoming.cleanup()
+            return outgoing
+        if outgoing:
+            data = self._mix(outgoing, data)
+
+        self._faded += 1
+        if self._faded >= self.fade_frames or self._current_done:
+            previous, self.current, self.incoming = self.current, incoming, None
+            previous.cleanup()
+        return data
+
+    def _mix(self, outgoing: bytes, incoming: bytes) -> bytes:
+        progress = (self._faded * SAMPLES_PER_FRAME + _RAMP * SAMPLES_PER_FRAME) / (self.fade_frames * SAMPLES_PER_FRAME)
+        angle = progress * np.float32(np.pi / 2)
+        a = np.frombuffer(outgoing, dtype=np.int16).reshape(-1, CHANNELS)
+        b = np.frombuffer(incoming, dtype=np.int16).reshape(-1, CHANNELS)
+        mixed = a * np.cos(angle) + b * np.sin(angle)
+        return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes()
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        self.current.cleanup()
+        if self.incoming is not None:
+            self.incoming.cleanup()
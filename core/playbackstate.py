@@ -0,0 +1,79 @@
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_PATH = os.path.join('databases', 'playback_state.db')
+
+# Tail rows read per query on resume.
+PAGE_SIZE = 256
+
+
+class PlaybackStateStore:
+    """
+    What each guild was playing, one row per guild, so playback picks up where it left off
+    after a restart. Sharded workers share the file: each one only writes the rows of its
+    own guilds, and resumes whichever rows belong to guilds it can see.
+
+    A state row only holds the part of the queue kept in memory. The spilled tail of a long
+    queue is copied into its own table, one row per track, and only when it has changed.
+
+    Args:
+        path (str, optional): The SQLite database file. Defaults to databases/playback_state.db.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        # Other workers may be writing at the same moment; wait for them instead of failing.
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS players (guild_id INTEGER PRIMARY KEY, state TEXT, updated_at REAL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS tails (guild_id INTEGER, seq INTEGER, data TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS tail_order ON tails (guild_id, seq)")
+
+    def save(self, states: dict, stopped=(), tails=None) -> None:
+        """
+        Stores several guilds' states in one transaction.
+
+        Args:
+            states (dict): Guild id to state, for every guild that is playing.
+            stopped (optional): Guild ids whose stored state is no longer current.
+            tails (dict, optional): Guild id to the pages of its new queue tail, as yielded by
+                TieredQueue.spilled_pages, for the guilds whose tail changed since the last save.
+        """
+        now = time.time()
+        with self.conn:
+            for guild_id, pages in (tails or {}).items():
+                self.conn.execute("DELETE FROM tails WHERE guild_id = ?", (guild_id,))
+                seq = 0
+                for page in pages:
+                    self.conn.executemany(
+                        "INSERT INTO tails (guild_id, seq, data) VALUES (?, ?, ?)",
+                        ((guild_id, seq + i, data) for i, data in enumerate(page))
+                    )
+                    seq += len(page)
+            self.conn.executemany(
+                "INSERT INTO players (guild_id, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                ((guild_id, json.dumps(state), now) for guild_id, state in states.items())
+            )
+            stopped = [(guild_id,) for guild_id in stopped]
+            self.conn.executemany("DELETE FROM players WHERE guild_id = ?", stopped)
+            self.conn.executemany("DELETE FROM tails WHERE guild_id = ?", stopped)
+
+    def load(self) -> dict:
+        """Returns every stored state by guild id."""
+        return {guild_id: json.loads(state) for guild_id, state in self.conn.execute("SELECT guild_id, state FROM players")}
+
+    def tail(self, guild_id: int):
+        """Yields a guild's saved queue tail in pages of up to PAGE_SIZE track dicts."""
+        seq = 0
+        while True:
+            page = [json.loads(data) for data, in self.conn.execute(
+                "SELECT data FROM tails WHERE guild_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (guild_id, seq, seq + PAGE_SIZE)
+            )]
+            if not page:
+                return
+            yield page
+            seq += len(page)
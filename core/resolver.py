@@ -0,0 +1,466 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import aiohttp
+import spotipy
+import yt_dlp
+from dotenv import load_dotenv
+from spotipy.oauth2 import SpotifyClientCredentials
+from core.streamurl import parse_expiry, EXPIRY_MARGIN
+
+# Where the shared resolver listens. Every worker process of a sharded deployment connects here.
+DEFAULT_SOCKET = os.path.join(os.getenv('XDG_RUNTIME_DIR') or '/tmp', 'waca-resolver.sock')
+
+# Cached metadata is dropped after this long even if its stream URL would still be valid.
+CACHE_TTL = 3 * 60 * 60
+CACHE_SIZE = 10000
+
+# Search results and playlist listings change slowly, but they do change.
+LISTING_TTL = 60 * 60
+
+# Responses can carry a whole playlist; the default 64 KiB line limit is too small for that.
+LINE_LIMIT = 16 * 1024 * 1024
+
+# How long (seconds) a client waits for any one response before giving up on the service.
+REQUEST_TIMEOUT = 120
+
+# Extraction threads kept warm by the service.
+EXTRACTION_WORKERS = 8
+
+YDL_OPTIONS = {
+    'format': 'bestaudio',
+    'ignoreerrors': True,
+    'noplaylist': True,
+    'nocheckcertificate': True,
+    'quiet': True,
+    'no_warnings': True,
+    'default_search': 'auto',
+    'source_address': '0.0.0.0'
+}
+
+
+_local = threading.local()
+
+
+def _youtube_dl() -> yt_dlp.YoutubeDL:
+    # One instance per thread: building one loads every extractor, and an instance isn't thread-safe.
+    if not hasattr(_local, 'ydl'):
+        _local.ydl = yt_dlp.YoutubeDL(YDL_OPTIONS)
+    return _local.ydl
+
+
+def classify_query(query: str) -> str:
+    """
+    Works out what a /play query points at.
+
+    Returns:
+        str: One of "spotify", "youtube_playlist", "youtube", "soundcloud" or "search".
+    """
+    if 'open.spotify.com' in query:
+        return 'spotify'
+    elif 'youtube.com/playlist' in query or ('youtube.com/watch?v=' in query and '&list=' in query):
+        return 'youtube_playlist'
+    elif re.match(r'^(https?:\/\/)?(www\.)?(youtube\.com|youtu\.?be)\/.+$', query):
+        return 'youtube'
+    elif 'soundcloud.com' in query:
+        return 'soundcloud'
+    return 'search'
+
+
+def download_info(url: str, retries: int = 3) -> Optional[dict]:
+    """
+    Extracts the stream URL and metadata of a track with yt-dlp. Blocking; run it in an executor.
+
+    Args:
+        url (str): The page URL or search term.
+        retries (int, optional): How often to retry on 403 Forbidden. Defaults to 3.
+
+    Returns:
+        Optional[dict]: The track info, or None if extraction failed.
+    """
+    for attempt in range(retries):
+        try:
+            info = _youtube_dl().extract_info(url, download=False)
+            if not info:
+                return None
+            if 'entries' in info:
+                info = info['entries'][0]
+            return {
+                'url': info['url'],
+                'title': info['title'],
+                'duration': info['duration'],
+                'thumbnail': info['thumbnail'],
+                'webpage_url': info.get('webpage_url') or url,
+                'abr': info.get('abr')
+            }
+        except yt_dlp.utils.DownloadError as e:
+            if '403 Forbidden' in str(e):
+                print(f"403 Forbidden error encountered. Retrying {attempt + 1}/{retries}...")
+                continue
+            else:
+                print(f"Error downloading info: {url} - {e}")
+                break
+    return None
+
+
+
+
+def create_spotify_client() -> Optional[spotipy.Spotify]:
+    """Builds a Spotify client from SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET, or None if they aren't set."""
+    client_id = os.getenv('SPOTIFY_CLIENT_ID')
+    client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
+    if not (client_id and client_secret):
+        return None
+    try:
+        spotify = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
+            client_id=client_id,
+            client_secret=client_secret
+        ))
+        print("Spotify client initialized successfully")
+        return spotify
+    except Exception as e:
+        print(f"Error initializing Spotify client: {e}")
+        return None
+
+
+async def search_youtube(session: aiohttp.ClientSession, api_key: str, query: str, max_results: int = 5) -> list:
+    """
+    Searches YouTube for videos.
+
+    Returns:
+        list: Up to max_results dicts with url, title and duration, empty on errors.
+    """
+    search_url = "https://www.googleapis.com/youtube/v3/search"
+    params = {
+        'part': 'snippet',
+        'q': query,
+        'type': 'video',
+        'key': api_key,
+        'maxResults': max_results
+    }
+    try:
+        async with session.get(search_url, params=params) as response:
+            if response.status == 200:
+                data = await response.json()
+                return [
+                    {
+                        'url': f"https://www.youtube.com/watch?v={item['id']['videoId']}",
+                        'title': item['snippet']['title'],
+                        'duration': 'Unknown'
+                    }
+                    for item in data['items']
+                ]
+            print(f"Error searching YouTube. Status code: {response.status}")
+    except Exception as e:
+        print(f"Error searching YouTube: {e}")
+    return []
+
+
+async def get_youtube_playlist_items(session: aiohttp.ClientSession, api_key: str, playlist_id: str) -> list:
+    """Lists the first 50 items of a YouTube playlist, empty on errors."""
+    playlist_url = f"https://www.googleapis.com/youtube/v3/playlistItems?part=snippet&maxResults=50&playlistId={playlist_id}&key={api_key}"
+    try:
+        async with session.get(playlist_url) as response:
+            if response.status == 200:
+                data = await response.json()
+                return data['items']
+            print(f"Error fetching YouTube playlist items. Status code: {response.status}")
+    except Exception as e:
+        print(f"Error fetching YouTube playlist items: {e}")
+    return []
+
+
+def get_spotify_tracks(spotify: Optional[spotipy.Spotify], url: str, retries: int = 3) -> list:
+    """
+    Lists the tracks behind a Spotify track, album or playlist link. Blocking; run it in an executor.
+
+    Returns:
+        list: (artist, title, duration in seconds) for every track, empty on errors.
+    """
+    if not spotify:
+        return []
+    print(f"Fetching Spotify tracks for URL: {url}")
+    for attempt in range(retries):
+        try:
+            if '/track/' in url:
+                track = spotify.track(url)
+                print(f"Found track: {track['name']} by {track['artists'][0]['name']}")
+                return [(track['artists'][0]['name'], track['name'], track['duration_ms'] // 1000)]
+            elif '/album/' in url:
+                album = spotify.album(url)
+                print(f"Found album: {album['name']} by {album['artists'][0]['name']}")
+                return [(track['artists'][0]['name'], track['name'], track['duration_ms'] // 1000) for track in album['tracks']['items']]
+            elif '/playlist/' in url:
+                playlist = spotify.playlist(url)
+                print(f"Found playlist: {playlist['name']} by {playlist['owner']['display_name']}")
+                return [(track['track']['artists'][0]['name'], track['track']['name'], track['track']['duration_ms'] // 1000) for track in playlist['tracks']['items']]
+            return []
+        except spotipy.exceptions.SpotifyException as e:
+            print(f"Error fetching Spotify tracks: {e}. Retrying {attempt + 1}/{retries}...")
+            time.sleep(1)  # Wait a bit before retrying
+    print("Failed to fetch Spotify tracks after retries.")
+    return []
+
+
+def service_running(path: str = DEFAULT_SOCKET) -> bool:
+    """Checks whether a resolver service is already listening on a socket."""
+    if not hasattr(socket, 'AF_UNIX'):
+        return False
+    with socket.socket(socket.AF_UNIX) as sock:
+        try:
+            sock.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+class ResolverService:
+    """
+    A long-lived resolver daemon. It keeps extraction threads, yt-dlp instances, an HTTP
+    connection pool, the Spotify client and its caches warm across bot restarts and cog
+    reloads, and serves every bot process on the host: a track resolved for one shard is
+    cached for all of them, and concurrent requests for the same thing share one lookup.
+
+    Requests and responses are JSON, one per line:
+        {"id": 1, "op": "extract", "args": {"url": "..."}}
+        {"id": 1, "result": {...}}  or  {"id": 1, "error": "..."}
+
+    Operations are extract (url), search (query), playlist (playlist_id), spotify (url) and stats.
+    A batch operation carries many requests in one round trip:
+        {"id": 2, "op": "batch", "args": {"requests": [{"op": "extract", "args": {...}}, ...]}}
+        {"id": 2, "result": [{"result": {...}}, {"error": "..."}, ...]}
+
+    Args:
+        path (str, optional): The Unix socket to listen on. Defaults to DEFAULT_SOCKET.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        load_dotenv()
+        self.path = path
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS)
+        self.youtube_api_key = os.getenv('YOUTUBE_API_KEY')
+        self.spotify = create_spotify_client()
+        self.session = None
+        self.cache = OrderedDict()
+        self.in_flight = {}
+        self.started = time.time()
+        self.stats = {'requests': 0, 'hits': 0, 'misses': 0, 'coalesced': 0}
+
+    async def serve(self) -> None:
+        if os.path.exists(self.path):
+            if service_running(self.path):
+                raise RuntimeError(f"A resolver is already listening on {self.path}")
+            os.remove(self.path)
+        self.session = aiohttp.ClientSession()
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.path, limit=LINE_LIMIT)
+        print(f"Resolver listening on {self.path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.session.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        lock = asyncio.Lock()
+
+        async def respond(request):
+            response = {'id': request.get('id')}
+            response.update(await self._settle(request.get('op'), request.get('args', {})))
+            async with lock:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                asyncio.create_task(respond(json.loads(line)))
+        except (ConnectionError, ValueError) as e:
+            print(f"Resolver client disconnected: {e}")
+        finally:
+            writer.close()
+
+    async def _settle(self, op: str, args: dict) -> dict:
+        try:
+            return {'result': await self.handle(op, args)}
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+
+    async def handle(self, op: str, args: dict):
+        self.stats['requests'] += 1
+        loop = asyncio.get_event_loop()
+        if op == 'batch':
+            return await asyncio.gather(*(self._settle(request['op'], request.get('args', {})) for request in args['requests']))
+        if op == 'extract':
+            url = args['url']
+            # Refreshes ask for a fresh extraction: the cached stream is the one that is about to expire.
+            return await self.cached(('extract', url), lambda: loop.run_in_executor(self.executor, download_info, url), self._stream_expiry, fresh=args.get('fresh', False))
+        if op == 'search':
+            query = args['query']
+            return await self.cached(('search', query), lambda: search_youtube(self.session, self.youtube_api_key, query))
+        if op == 'playlist':
+            playlist_id = args['playlist_id']
+            return await self.cached(('playlist', playlist_id), lambda: get_youtube_playlist_items(self.session, self.youtube_api_key, playlist_id))
+        if op == 'spotify':
+            url = args['url']
+            return await self.cached(('spotify', url), lambda: loop.run_in_executor(self.executor, get_spotify_tracks, self.spotify, url))
+        if op == 'stats':
+            return dict(self.stats, cached=len(self.cache), in_flight=len(self.in_flight), uptime=time.time() - self.started)
+        raise ValueError(f"Unknown operation {op}")
+
+    @staticmethod
+    def _stream_expiry(info: dict) -> float:
+        # Extracted metadata is only good for as long as the stream URL inside it.
+        valid_until = time.time() + CACHE_TTL
+        expires = parse_expiry(info['url'])
+        if expires:
+            valid_until = min(valid_until, expires - EXPIRY_MARGIN)
+        return valid_until
+
+    async def cached(self, key: tuple, fetch, expiry=None, fresh: bool = False):
+        """
+        Looks a result up in the cache, joins a lookup that is already running, or starts one.
+
+        Args:
+            key (tuple): The operation and its argument.
+            fetch: Starts the lookup; returns an awaitable.
+            expiry (optional): Computes when a result goes stale. Defaults to LISTING_TTL from now.
+            fresh (bool, optional): Skips the cache (but still joins a running lookup) and replaces the cached result.
+        """
+        entry = None if fresh else self.cache.get(key)
+        if entry and entry[0] > time.time():
+            self.cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+        if key in self.in_flight:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        self.stats['misses'] += 1
+        future = self.in_flight[key] = asyncio.ensure_future(fetch())
+        try:
+            # Shielded, so a client that goes away doesn't cancel the lookup for everyone else waiting on it.
+            value = await asyncio.shield(future)
+        finally:
+            self.in_flight.pop(key, None)
+        if value:
+            self.cache[key] = (expiry(value) if expiry else time.time() + LISTING_TTL, value)
+            if len(self.cache) > CACHE_SIZE:
+                self.cache.popitem(last=False)
+        return value
+
+
+class ResolverClient:
+    """
+    Talks to a ResolverService over its Unix socket. One connection per process,
+    with any number of requests in flight on it at once.
+
+    Args:
+        path (str, optional): The service's Unix socket. Defaults to DEFAULT_SOCKET.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        self.path = path
+        self.reader = None
+        self.writer = None
+        self.pending = {}
+        self.next_id = 0
+        self.connect_lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        async with self.connect_lock:
+            if self.writer and not self.writer.is_closing():
+                return
+            self.reader, self.writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+            asyncio.create_task(self._read_responses(self.reader))
+
+    async def _read_responses(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while line := await reader.readline():
+                response = json.loads(line)
+                future = self.pending.pop(response['id'], None)
+                if future and not future.done():
+                    if 'error' in response:
+                        future.set_exception(RuntimeError(response['error']))
+                    else:
+                        future.set_result(response.get('result'))
+        finally:
+            # Whatever was still waiting will never get an answer on this connection.
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Resolver connection lost"))
+            self.pending.clear()
+            if self.writer:
+                self.writer.close()
+
+    async def request(self, op: str, timeout: float = REQUEST_TIMEOUT, **args):
+        """
+        Sends one request and waits for its response.
+
+        Args:
+            op (str): The operation, e.g. "extract".
+            timeout (float, optional): How long to wait for the response. Defaults to REQUEST_TIMEOUT.
+            **args: The operation's arguments.
+
+        Raises:
+            ConnectionError: If the service is unreachable or went away.
+            TimeoutError: If the service didn't answer in time.
+            RuntimeError: If the service failed to handle the request.
+        """
+        await self._connect()
+        self.next_id += 1
+        request_id = self.next_id
+        future = self.pending[request_id] = asyncio.get_event_loop().create_future()
+        self.writer.write(json.dumps({'id': request_id, 'op': op, 'args': args}).encode() + b'\n')
+        await self.writer.drain()
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.pending.pop(request_id, None)
+            # The builtin one, which callers already handle as an OSError.
+            raise TimeoutError(f"Resolver didn't answer {op} within {timeout:g}s") from None
+
+    async def batch(self, requests: list) -> list:
+        """
+        Sends several requests in one round trip.
+
+        Args:
+            requests (list): (op, args) pairs.
+
+        Returns:
+            list: One {"result": ...} or {"error": ...} dict per request, in order.
+        """
+        return await self.request('batch', requests=[{'op': op, 'args': args} for op, args in requests])
+
+    async def extract(self, url: str, fresh: bool = False) -> Optional[dict]:
+        return await self.request('extract', url=url, fresh=fresh)
+
+    async def extract_many(self, urls: list) -> list:
+        """Extracts several tracks in one round trip; failed ones come back as None."""
+        responses = await self.batch([('extract', {'url': url}) for url in urls])
+        return [response.get('result') for response in responses]
+
+    async def search(self, query: str) -> list:
+        return await self.request('search', query=query)
+
+    async def playlist(self, playlist_id: str) -> list:
+        return await self.request('playlist', playlist_id=playlist_id)
+
+    async def spotify(self, url: str) -> list:
+        return await self.request('spotify', url=url)
+
+
+def run_service(path: str = DEFAULT_SOCKET) -> None:
+    """Runs a resolver service until the process is killed."""
+    asyncio.run(ResolverService(path).serve())
+
+
+if __name__ == "__main__":
+    # python -m core.resolver [socket path]
+    run_service(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SOCKET)
@@ -0,0 +1,101 @@
+import asyncio
+import secrets
+import time
+from typing import Optional
+
+# How long (seconds) a search menu can still be used to pick a song.
+SEARCH_TTL = 60
+
+
+class PendingSearch:
+    """
+    A search whose menu is waiting for a pick: just the result URLs, who may pick and where
+    the pick goes in the queue, plus any resolutions already started for it.
+    """
+
+    __slots__ = ('urls', 'author_id', 'position', 'expires', 'resolutions')
+
+    def __init__(self, urls, author_id: int, position: Optional[int], expires: float):
+        self.urls = tuple(urls)
+        self.author_id = author_id
+        self.position = position
+        self.expires = expires
+        self.resolutions = {}
+
+    def resolve(self, index: int, process) -> asyncio.Future:
+        """
+        Resolves one result with process(url), once; a speculative start and the pick share it.
+
+        Returns:
+            asyncio.Future: Resolves to whatever process returns.
+        """
+        task = self.resolutions.get(index)
+        if task is None or task.cancelled():
+            task = self.resolutions[index] = asyncio.ensure_future(process(self.urls[index]))
+        return task
+
+    def cancel(self, keep: Optional[int] = None) -> None:
+        """Cancels the resolutions of every result but keep."""
+        for index, task in self.resolutions.items():
+            if index != keep:
+                task.cancel()
+
+
+class PendingSearches:
+    """
+    Open search menus by token. The token goes in the menu's custom_id, so the pick can be
+    handled by a listener instead of a coroutine kept waiting on the menu.
+
+    Args:
+        ttl (float, optional): How long a search stays open. Defaults to SEARCH_TTL.
+    """
+
+    def __init__(self, ttl: float = SEARCH_TTL):
+        self.ttl = ttl
+        # Insertion order is expiry order, since every entry lives for the same ttl.
+        self.entries = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, urls, author_id: int, position: Optional[int] = None) -> tuple:
+        """
+        Opens a search.
+
+        Returns:
+            tuple: The token, and the PendingSearch it stands for.
+        """
+        token = secrets.token_urlsafe(9)
+        search = self.entries[token] = PendingSearch(urls, author_id, position, time.monotonic() + self.ttl)
+        return token, search
+
+    def get(self, token: str) -> Optional[PendingSearch]:
+        search = self.entries.get(token)
+        if search and search.expires <= time.monotonic():
+            # expire() won't see it once it's gone, so stop what it was resolving here.
+            self.pop(token)
+            search.cancel()
+            return None
+        return search
+
+    def pop(self, token: str) -> Optional[PendingSearch]:
+        return self.entries.pop(token, None)
+
+    def expire(self) -> int:
+        """
+        Drops every search that is past its ttl and cancels whatever it was still resolving.
+
+        Returns:
+            int: How many were dropped.
+        """
+        now = time.monotonic()
+        expired = 0
+        while self.entries:
+            token = next(iter(self.entries))
+            search = self.entries[token]
+            if search.expires > now:
+                break
+            del self.entries[token]
+            search.cancel()
+            expired += 1
+        return expired
@@ -0,0 +1,57 @@
+import re
+import time
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+# Re-resolve a stream this long before it actually expires, so FFmpeg never
+# opens a URL that dies halfway through the track.
+EXPIRY_MARGIN = 300
+
+# Only refresh entries expected to play within this window. A freshly signed
+# googlevideo URL lives for ~6 hours, so refreshing anything further out than
+# that is wasted extraction work: the new URL would expire before playback too.
+REFRESH_LOOKAHEAD = 45 * 60
+
+_PATH_EXPIRE = re.compile(r'/expire/(\d+)')
+
+
+def parse_expiry(url: Optional[str]) -> Optional[int]:
+    """
+    Extracts the expiry timestamp from a signed stream URL.
+
+    Args:
+        url (Optional[str]): The resolved stream URL (googlevideo, SoundCloud CDN, ...).
+
+    Returns:
+        Optional[int]: The UNIX timestamp the URL expires at, or None if it carries no expiry.
+    """
+    if not url:
+        return None
+    parsed = urlparse(url)
+    values = parse_qs(parsed.query).get('expire')
+    if values and values[0].isdigit():
+        return int(values[0])
+    match = _PATH_EXPIRE.search(parsed.path)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def expires_within(track, seconds: float, now: Optional[float] = None) -> bool:
+    """
+    Checks whether a track's stream URL will be dead `seconds` from now (plus the safety margin).
+
+    Args:
+        track (Track): The queued track; one without a stream reads as already expired.
+        seconds (float): How far in the future the URL has to stay valid.
+        now (Optional[float]): The current time, defaults to time.time().
+
+    Returns:
+        bool: True if the track needs to be re-resolved before then.
+    """
+    expires = track.expires
+    if expires is None:
+        return False
+    if now is None:
+        now = time.time()
+    return expires - EXPIRY_MARGIN <= now + seconds
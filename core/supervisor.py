@@ -0,0 +1,184 @@
+import asyncio
+import os
+import time
+import weakref
+import psutil
+from typing import Optional
+from core.buffering import find_ffmpeg_processes
+
+# Hard cap on FFmpeg/ffprobe processes across the whole bot.
+MAX_PROCESSES = int(os.getenv('MAX_FFMPEG_PROCESSES', 32))
+
+# Background work (loudness/silence analysis) leaves this many slots free for playback.
+BACKGROUND_HEADROOM = 4
+
+# How long a new stream waits for a free slot before giving up.
+ADMISSION_TIMEOUT = 20.0
+
+# Children nobody registered (ffprobe runs inside disnake) are left alone for this long.
+ORPHAN_GRACE = 30.0
+
+_NAMES = ('ffmpeg', 'ffprobe', 'avconv', 'avprobe')
+
+
+class AdmissionError(Exception):
+    """Raised when no FFmpeg slot freed up in time."""
+
+
+class Child:
+    def __init__(self, process: psutil.Process, kind: str, guild_id: Optional[int], owner):
+        self.process = process
+        self.kind = kind
+        self.guild_id = guild_id
+        self.owner = weakref.ref(owner) if owner is not None else None
+        self.started = time.monotonic()
+        self.cpu = 0.0
+        self.rss = 0
+
+    def orphaned(self) -> bool:
+        # Owned processes outlive their source when it was dropped or closed without killing them.
+        if self.owner is None:
+            return False
+        owner = self.owner()
+        return owner is None or getattr(owner, 'closed', False)
+
+
+class ProcessSupervisor:
+    """
+    Keeps an eye on every FFmpeg and ffprobe child of the bot: who started it, what it costs,
+    whether it should still be running, and whether there's room to start another one.
+
+    Args:
+        limit (int, optional): The maximum number of concurrent processes. Defaults to MAX_PROCESSES.
+    """
+
+    def __init__(self, limit: int = MAX_PROCESSES):
+        self.limit = limit
+        self.children = {}
+        self.reaped = 0
+        self.rejected = 0
+
+    def register(self, pid: int, kind: str, guild_id: Optional[int] = None, owner=None) -> None:
+        """
+        Attributes a child process to a guild and, optionally, to the object whose lifetime it should follow.
+
+        Args:
+            pid (int): The process id.
+            kind (str): What the process does, e.g. "playback" or "analysis".
+            guild_id (Optional[int]): The guild it works for.
+            owner (optional): Once this object is garbage collected or has .closed set, the process is an orphan.
+        """
+        try:
+            self.children[pid] = Child(psutil.Process(pid), kind, guild_id, owner)
+        except psutil.Error:
+            pass
+
+    def register_source(self, source, guild_id: Optional[int], owner) -> None:
+        """Registers the FFmpeg processes behind an audio source, see register."""
+        for process in find_ffmpeg_processes(source):
+            if process.pid not in self.children:
+                self.register(process.pid, 'playback', guild_id, owner)
+
+    def running(self) -> int:
+        """Counts live FFmpeg/ffprobe children, including ones nobody registered."""
+        return len(self._discover())
+
+    def _discover(self) -> list:
+        try:
+            children = psutil.Process().children()
+        except psutil.Error:
+            return []
+        found = []
+        for child in children:
+            try:
+                if child.name().lower().split('.')[0] in _NAMES and child.status() != psutil.STATUS_ZOMBIE:
+                    found.append(child)
+            except psutil.Error:
+                continue
+        return found
+
+    async def admit(self, background: bool = False, timeout: float = ADMISSION_TIMEOUT) -> None:
+        """
+        Waits for a free process slot.
+
+        Args:
+            background (bool, optional): Whether this is deferrable work that should leave headroom for playback.
+            timeout (float, optional): How long to wait. Defaults to ADMISSION_TIMEOUT.
+
+        Raises:
+            AdmissionError: If no slot freed up in time.
+        """
+        limit = self.limit - BACKGROUND_HEADROOM if background else self.limit
+        deadline = time.monotonic() + timeout
+        while self.running() >= limit:
+            self.reap()
+            if time.monotonic() >= deadline:
+                self.rejected += 1
+                raise AdmissionError(f"{self.limit} FFmpeg processes are already running")
+            await asyncio.sleep(0.5)
+
+    def sample(self) -> list:
+        """
+        Samples CPU and memory of every tracked child.
+
+        Returns:
+            list: The live Child records, registered or discovered.
+        """
+        for process in self._discover():
+            if process.pid not in self.children:
+                self.children[process.pid] = Child(process, process.name(), None, None)
+        live = []
+        for pid, child in list(self.children.items()):
+            try:
+                child.cpu = child.process.cpu_percent(interval=None)
+                child.rss = child.process.memory_info().rss
+                live.append(child)
+            except psutil.Error:
+                del self.children[pid]
+        return live
+
+    def reap(self) -> int:
+        """
+        Kills orphaned children and collects exited ones.
+
+        Returns:
+            int: How many processes were cleaned up.
+        """
+        cleaned = 0
+        now = time.monotonic()
+        for pid, child in list(self.children.items()):
+            try:
+                status = child.process.status()
+            except psutil.NoSuchProcess:
+                del self.children[pid]
+                continue
+            except psutil.Error:
+                continue
+            unowned = child.owner is None and child.kind not in ('playback', 'analysis') and now - child.started > ORPHAN_GRACE
+            killed = False
+            if status != psutil.STATUS_ZOMBIE and (child.orphaned() or unowned):
+                print(f"Killing orphaned {child.kind} process {pid} (guild {child.guild_id})")
+                try:
+                    child.process.kill()
+                    killed = True
+                except psutil.Error:
+                    pass
+            if child.kind == 'analysis' or not (killed or status == psutil.STATUS_ZOMBIE):
+                # Only collect what has exited or was just killed. asyncio's child watcher collects
+                # analysis processes itself, so don't steal their exit status.
+                continue
+            try:
+                # Collects the exit status, so killed or finished children don't linger as zombies.
+                child.process.wait(timeout=0)
+                del self.children[pid]
+                cleaned += 1
+            except psutil.TimeoutExpired:
+                continue
+            except psutil.Error:
+                del self.children[pid]
+        self.reaped += cleaned
+        return cleaned
+
+
+# Shared by every player in the process.
+supervisor = ProcessSupervisor()
@@ -0,0 +1,410 @@
+import itertools
+import json
+import random
+import sqlite3
+from core.trackqueue import TrackQueue
+
+DEFAULT_PATH = 'queue_spill.db'
+
+# The head keeps between HEAD_SIZE / 2 and 2 * HEAD_SIZE tracks in memory; everything
+# behind it is spilled to SQLite.
+HEAD_SIZE = 256
+
+# Rows read per query when walking the spilled tail.
+PAGE_SIZE = 256
+
+# Tail versions, unique across every queue in the process.
+_versions = itertools.count()
+
+
+class QueueStore:
+    """
+    The SQLite file the tails of every guild's queue spill into. It only holds scratch
+    data: a queue's rows are dropped whenever a queue with that key is created.
+
+    Args:
+        path (str, optional): The SQLite database file. Defaults to queue_spill.db.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.conn = sqlite3.connect(path)
+        # Losing the file on a crash loses nothing the playback state doesn't have.
+        self.conn.execute("PRAGMA synchronous = OFF")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS tail (queue TEXT, seq INTEGER, weight REAL, data TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS tail_order ON tail (queue, seq)")
+
+
+class TieredQueue:
+    """
+    A TrackQueue whose head stays in memory while the rest lives in SQLite. The head is
+    refilled from the tail as tracks are taken off it, and spills into the tail when it
+    grows past twice its size, so memory per queue stays bounded however long it gets.
+
+    Tail rows are numbered consecutively in play order, so the track at any position is
+    one indexed lookup. Inserting into or removing from the middle of the tail renumbers
+    the rows behind it, in one UPDATE.
+
+    Args:
+        store (QueueStore): Where the tail is kept.
+        key: Identifies this queue in the store, e.g. the guild id.
+        weight (optional): Maps a track to its weight, as for TrackQueue.
+        dump (optional): Turns a track into something JSON can store. Defaults to the track itself.
+        load (optional): The inverse of dump.
+        head_size (int, optional): See HEAD_SIZE.
+    """
+
+    def __init__(self, store, key, weight=None, dump=None, load=None, head_size: int = HEAD_SIZE):
+        self.conn = store.conn
+        self.key = str(key)
+        self.weight = weight or (lambda item: 0)
+        self.dump = dump or (lambda item: item)
+        self.load = load or (lambda data: data)
+        self.head_size = head_size
+        self.head = TrackQueue(weight=weight)
+        # Tail rows are numbered first_seq to first_seq + tail_length - 1.
+        self.first_seq = 0
+        self.tail_length = 0
+        self.tail_weight = 0
+        with self.conn:
+            self.conn.execute("DELETE FROM tail WHERE queue = ?", (self.key,))
+
+    def __len__(self) -> int:
+        return len(self.head) + self.tail_length
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self):
+        yield from self.head
+        # Keyed on seq rather than offset, so each page is an index range scan.
+        seq = self.first_seq
+        stop = self.first_seq + self.tail_length
+        while seq < stop:
+            rows = self._rows(seq, min(stop, seq + PAGE_SIZE))
+            if not rows:
+                break
+            yield from rows
+            seq += len(rows)
+
+    def __contains__(self, item) -> bool:
+        try:
+            self.index(item)
+        except ValueError:
+            return False
+        return True
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            return self.slice(start, stop)
+        index = self._normalize(index)
+        if index < len(self.head):
+            return self.head[index]
+        return self._rows(self._seq(index), self._seq(index) + 1)[0]
+
+    @property
+    def tail_length(self) -> int:
+        return self._tail_length
+
+    @tail_length.setter
+    def tail_length(self, value: int) -> None:
+        # Everything that changes the tail sets its length, so this is where its version moves on.
+        self._tail_length = value
+        self.version = next(_versions)
+
+    @property
+    def spilled(self) -> int:
+        """How many tracks are in SQLite rather than memory."""
+        return self.tail_length
+
+    def spilled_pages(self):
+        """
+        Yields the tail as stored, without decoding it: lists of up to PAGE_SIZE JSON strings, in
+        play order. Its version tells whether a copy of it is still current.
+        """
+        seq = self.first_seq
+        stop = self.first_seq + self.tail_length
+        while seq < stop:
+            page = [data for data, in self.conn.execute(
+                "SELECT data FROM tail WHERE queue = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (self.key, seq, min(stop, seq + PAGE_SIZE))
+            )]
+            if not page:
+                break
+            yield page
+            seq += len(page)
+
+    def _normalize(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("queue index out of range")
+        return index
+
+    def _seq(self, index: int) -> int:
+        return self.first_seq + index - len(self.head)
+
+    def _rows(self, start: int, stop: int) -> list:
+        rows = self.conn.execute(
+            "SELECT data FROM tail WHERE queue = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (self.key, start, stop)
+        )
+        return [self.load(json.loads(data)) for data, in rows]
+
+    def _write(self, seq: int, items) -> None:
+        self.conn.executemany(
+            "INSERT INTO tail (queue, seq, weight, data) VALUES (?, ?, ?, ?)",
+            ((self.key, seq + i, self.weight(item), json.dumps(self.dump(item))) for i, item in enumerate(items))
+        )
+
+    def _shift(self, seq: int, delta: int) -> None:
+        # Renumbers every row from seq on, opening (or closing) a gap in the numbering.
+        self.conn.execute("UPDATE tail SET seq = seq + ? WHERE queue = ? AND seq >= ?", (delta, self.key, seq))
+
+    def _spill(self) -> None:
+        # Moves what's past the head size to the front of the tail.
+        if len(self.head) <= 2 * self.head_size:
+            return
+        items = self.head.slice(self.head_size, len(self.head))
+        for _ in items:
+            self.head.pop()
+        self.first_seq -= len(items)
+        with self.conn:
+            self._write(self.first_seq, items)
+        self.tail_length += len(items)
+        self.tail_weight += sum(map(self.weight, items))
+
+    def _refill(self) -> None:
+        if len(self.head) >= self.head_size // 2 or not self.tail_length:
+            return
+        count = min(self.tail_length, self.head_size - len(self.head))
+        items = self._rows(self.first_seq, self.first_seq + count)
+        with self.conn:
+            self.conn.execute("DELETE FROM tail WHERE queue = ? AND seq < ?", (self.key, self.first_seq + count))
+        self.first_seq += count
+        self.tail_length -= count
+        self.tail_weight -= sum(map(self.weight, items))
+        self.head.extend(items)
+
+    def total_weight(self):
+        """Sums the weight of every track in the queue."""
+        return self.head.total_weight() + self.tail_weight
+
+    def weight_before(self, index: int):
+        """Sums the weight of the tracks ahead of position index."""
+        if index <= len(self.head):
+            return self.head.weight_before(index)
+        if index >= len(self):
+            return self.total_weight()
+        total, = self.conn.execute(
+            "SELECT SUM(weight) FROM tail WHERE queue = ? AND seq < ?", (self.key, self._seq(index))
+        ).fetchone()
+        return self.head.total_weight() + (total or 0)
+
+    def slice(self, start: int, stop: int) -> list:
+        """Copies out tracks start to stop (exclusive); only tail rows in that range are read."""
+        start = max(0, min(start, len(self)))
+        stop = max(start, min(stop, len(self)))
+        result = self.head.slice(start, stop)
+        if stop > len(self.head):
+            result.extend(self._rows(self._seq(max(start, len(self.head))), self._seq(stop)))
+        return result
+
+    def append(self, item) -> None:
+        self.extend([item])
+
+    def extend(self, items) -> None:
+        items = list(items)
+        if not self.tail_length:
+            room = max(0, 2 * self.head_size - len(self.head))
+            self.head.extend(items[:room])
+            items = items[room:]
+        if items:
+            # One transaction for the lot, so queueing a huge playlist is a single write.
+            with self.conn:
+                self._write(self.first_seq + self.tail_length, items)
+            self.tail_length += len(items)
+            self.tail_weight += sum(map(self.weight, items))
+
+    def appendleft(self, item) -> None:
+        self.insert(0, item)
+
+    def insert(self, index: int, item) -> None:
+        """Inserts a track so that it ends up at position index."""
+        self.insert_many(index, [item])
+
+    def insert_many(self, index: int, items) -> None:
+        """Inserts several tracks at once so that the first one ends up at position index."""
+        items = list(items)
+        if index < 0:
+            index = max(0, index + len(self))
+        if index >= len(self):
+            self.extend(items)
+        elif index <= len(self.head):
+            self.head.insert_many(index, items)
+            self._spill()
+        else:
+            seq = self._seq(index)
+            with self.conn:
+                self._shift(seq, len(items))
+                self._write(seq, items)
+            self.tail_length += len(items)
+            self.tail_weight += sum(map(self.weight, items))
+
+    def pop(self, index: int = -1):
+        """Removes and returns the track at position index."""
+        index = self._normalize(index)
+        if index < len(self.head):
+            item = self.head.pop(index)
+            self._refill()
+            return item
+        seq = self._seq(index)
+        item = self._rows(seq, seq + 1)[0]
+        with self.conn:
+            self.conn.execute("DELETE FROM tail WHERE queue = ? AND seq = ?", (self.key, seq))
+            self._shift(seq + 1, -1)
+        self.tail_length -= 1
+        self.tail_weight -= self.weight(item)
+        return item
+
+    def popleft(self):
+        if not self:
+            raise IndexError("pop from an empty queue")
+        return self.pop(0)
+
+    def index(self, item) -> int:
+        try:
+            return self.head.index(item)
+        except ValueError:
+            pass
+        # Tail rows are fresh copies, so look for one that stores the same thing.
+        row = self.conn.execute(
+            "SELECT seq FROM tail WHERE queue = ? AND data = ? ORDER BY seq LIMIT 1",
+            (self.key, json.dumps(self.dump(item)))
+        ).fetchone()
+        if row is None:
+            raise ValueError("track is not in the queue")
+        return len(self.head) + row[0] - self.first_seq
+
+    def remove(self, item) -> None:
+        self.pop(self.index(item))
+
+    def move(self, source: int, destination: int):
+        """Moves the track at position source so it ends up at position destination, and returns it."""
+        destination = self._normalize(destination)
+        item = self.pop(source)
+        self.insert(destination, item)
+        return item
+
+    def shuffle(self) -> None:
+        """
+        Shuffles the whole queue in one pass. Tail rows are only renumbered, never decoded,
+        and tracks that stay in the head keep their objects (and whatever they have resolved).
+        """
+        if not self.tail_length:
+            items = self.head.slice(0, len(self.head))
+            random.shuffle(items)
+            self.head.clear()
+            self.head.extend(items)
+            return
+        rowids = [rowid for rowid, in self.conn.execute("SELECT rowid FROM tail WHERE queue = ?", (self.key,))]
+        # Each slot is either a track from the head or the row id of one in the tail.
+        order = [(item, None) for item in self.head] + [(None, rowid) for rowid in rowids]
+        random.shuffle(order)
+        keep, rest = order[:self.head_size], order[self.head_size:]
+        wanted = [rowid for item, rowid in keep if item is None]
+        loaded = {}
+        for start in range(0, len(wanted), PAGE_SIZE):
+            chunk = wanted[start:start + PAGE_SIZE]
+            rows = self.conn.execute(
+                f"SELECT rowid, data FROM tail WHERE rowid IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            loaded.update((rowid, self.load(json.loads(data))) for rowid, data in rows)
+        head = [item if item is not None else loaded[rowid] for item, rowid in keep]
+        total = self.total_weight()
+        with self.conn:
+            self.conn.executemany("DELETE FROM tail WHERE rowid = ?", ((rowid,) for rowid in wanted))
+            self.conn.executemany(
+                "UPDATE tail SET seq = ? WHERE rowid = ?",
+                ((seq, rowid) for seq, (item, rowid) in enumerate(rest) if item is None)
+            )
+            self.conn.executemany(
+                "INSERT INTO tail (queue, seq, weight, data) VALUES (?, ?, ?, ?)",
+                ((self.key, seq, self.weight(item), json.dumps(self.dump(item))) for seq, (item, rowid) in enumerate(rest) if item is not None)
+            )
+        self.head.clear()
+        self.head.extend(head)
+        self.first_seq = 0
+        self.tail_length = len(rest)
+        self.tail_weight = total - self.head.total_weight()
+
+    def dedupe(self, key) -> int:
+        """
+        Drops every track whose key was already seen earlier in the queue, in one pass that
+        keeps a hash set of the keys seen so far.
+
+        Args:
+            key: Maps a track to the id duplicates share.
+
+        Returns:
+            int: How many tracks were removed.
+        """
+        seen = set()
+        head = []
+        for item in self.head:
+            item_key = key(item)
+            if item_key not in seen:
+                seen.add(item_key)
+                head.append(item)
+        removed = len(self.head) - len(head)
+        if removed:
+            self.head.clear()
+            self.head.extend(head)
+
+        duplicates = []
+        survivors = []
+        duplicate_weight = 0
+        seq = self.first_seq
+        stop = self.first_seq + self.tail_length
+        while seq < stop:
+            rows = self.conn.execute(
+                "SELECT rowid, weight, data FROM tail WHERE queue = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (self.key, seq, min(stop, seq + PAGE_SIZE))
+            ).fetchall()
+            if not rows:
+                break
+            for rowid, weight, data in rows:
+                item_key = key(self.load(json.loads(data)))
+                if item_key in seen:
+                    duplicates.append(rowid)
+                    duplicate_weight += weight
+                else:
+                    seen.add(item_key)
+                    if duplicates:
+                        # Rows ahead of the first duplicate keep their numbers.
+                        survivors.append(rowid)
+            seq += len(rows)
+        if duplicates:
+            first = stop - len(survivors) - len(duplicates)
+            with self.conn:
+                self.conn.executemany("DELETE FROM tail WHERE rowid = ?", ((rowid,) for rowid in duplicates))
+                self.conn.executemany(
+                    "UPDATE tail SET seq = ? WHERE rowid = ?",
+                    ((first + i, rowid) for i, rowid in enumerate(survivors))
+                )
+            self.tail_length -= len(duplicates)
+            self.tail_weight -= duplicate_weight
+            removed += len(duplicates)
+        self._refill()
+        return removed
+
+    def clear(self) -> None:
+        self.head.clear()
+        with self.conn:
+            self.conn.execute("DELETE FROM tail WHERE queue = ?", (self.key,))
+        self.first_seq = 0
+        self.tail_length = 0
+        self.tail_weight = 0
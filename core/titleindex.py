@@ -0,0 +1,109 @@
+import heapq
+import re
+from collections import Counter, defaultdict
+
+# Discord shows at most this many autocomplete choices.
+MAX_SUGGESTIONS = 25
+
+# A fuzzy match needs at least this share of the trigrams it is scored on.
+FUZZY_THRESHOLD = 0.5
+
+# The fuzzy pass scores titles on at most this many of the query's rarest trigrams, and skips any
+# trigram more titles than FUZZY_POSTING_LIMIT share: common ones say little and cost the most.
+FUZZY_GRAMS = 6
+FUZZY_POSTING_LIMIT = 2000
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize(text: str) -> str:
+    """Lowercases text and turns every run of punctuation or spaces into one space."""
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def trigrams(text: str) -> set:
+    """The three-character substrings of normalized text, padded so word starts count too."""
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """
+    An in-memory trigram index over the titles of known tracks, for answering autocomplete
+    without a search API call. A lookup intersects the posting sets of the query's trigrams,
+    smallest first, so it only touches titles that can match.
+
+    Tracks are identified by their page URL, the same id the track database uses.
+    """
+
+    def __init__(self):
+        self.titles = {}
+        self.postings = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def __contains__(self, track_id) -> bool:
+        return track_id in self.titles
+
+    def add(self, track_id: str, title: str, duration=0) -> None:
+        """Indexes a track's title; adding a known track again just updates it."""
+        if track_id in self.titles:
+            self.remove(track_id)
+        key = normalize(title)
+        self.titles[track_id] = (title, duration, key)
+        for gram in trigrams(key):
+            self.postings[gram].add(track_id)
+
+    def remove(self, track_id: str) -> None:
+        title, duration, key = self.titles.pop(track_id)
+        for gram in trigrams(key):
+            self.postings[gram].discard(track_id)
+            if not self.postings[gram]:
+                del self.postings[gram]
+
+    def search(self, query: str, limit: int = MAX_SUGGESTIONS) -> list:
+        """
+        Finds titles matching query: those containing it first, then those containing all of its
+        trigrams in another order, then, if that still leaves room, close misspellings.
+
+        Returns:
+            list: Up to limit (track id, title, duration) tuples.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        grams = trigrams(query)
+        sets = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        candidates = set(sets[0])
+        for posting in sets[1:]:
+            if not candidates:
+                break
+            candidates &= posting
+
+        exact = []
+        partial = []
+        for track_id in candidates:
+            title, duration, key = self.titles[track_id]
+            (exact if query in key else partial).append((len(key), track_id))
+        # Only the best few are shown, so there is no need to sort every match of a short query.
+        ranked = heapq.nsmallest(limit, exact)
+        if len(ranked) < limit:
+            ranked += heapq.nsmallest(limit - len(ranked), partial)
+
+        scored = [posting for posting in sets if 0 < len(posting) <= FUZZY_POSTING_LIMIT][:FUZZY_GRAMS]
+        if len(ranked) < limit and len(grams) > 2 and len(scored) > 1:
+            # Typos: score the titles sharing one of the query's rarest trigrams by how many they share.
+            # This runs on every keystroke, so it stays bounded however large the index grows.
+            shared = Counter()
+            for posting in scored:
+                shared.update(posting)
+            needed = len(scored) * FUZZY_THRESHOLD
+            fuzzy = heapq.nsmallest(limit - len(ranked), (
+                (-count, len(self.titles[track_id][2]), track_id)
+                for track_id, count in shared.items()
+                if count >= needed and track_id not in candidates
+            ))
+            ranked += [(length, track_id) for _, length, track_id in fuzzy]
+
+        return [(track_id, *self.titles[track_id][:2]) for _, track_id in ranked[:limit]]
@@ -0,0 +1,94 @@
+import sys
+from typing import Optional
+from core.streamurl import parse_expiry
+
+# Queued tracks keep their stream URL only while they are this close to the head of the queue.
+STREAM_WINDOW = 25
+
+# What a track's saved state holds; stream URLs and probe results don't outlive the process.
+_SAVED = ('webpage_url', 'title', 'duration', 'thumbnail', 'abr', 'loudness', 'trim_start', 'trim_end')
+
+
+class Stream:
+    """A resolved, signed stream URL and when it stops working."""
+
+    __slots__ = ('url', 'expires')
+
+    def __init__(self, url: str):
+        self.url = url
+        self.expires = parse_expiry(url)
+
+
+class Track:
+    """
+    A queued or playing track. Slotted, with a numeric duration and an interned page URL,
+    so that the same track queued in many guilds shares one copy of its id. The stream URL,
+    by far the largest field, lives in a separate Stream that is only kept while the track
+    is near the head of a queue; anything further out is re-resolved on its way there.
+
+    Args:
+        webpage_url (str): The page the track was resolved from; identifies it.
+        title (str): The title.
+        duration (optional): The length in seconds. Defaults to 0 (unknown).
+        thumbnail (Optional[str]): The thumbnail URL.
+        abr (optional): The source's audio bitrate in kbps, if known.
+        url (Optional[str]): The resolved stream URL, if any.
+    """
+
+    __slots__ = ('webpage_url', 'title', 'duration', 'thumbnail', 'abr', 'stream', 'codec', 'loudness', 'trim_start', 'trim_end')
+
+    def __init__(self, webpage_url: str, title: str, duration=0, thumbnail: Optional[str] = None, abr=None, url: Optional[str] = None):
+        self.webpage_url = sys.intern(webpage_url)
+        self.title = title
+        self.duration = int(duration or 0)
+        self.thumbnail = thumbnail
+        self.abr = abr
+        self.stream = Stream(url) if url else None
+        self.codec = None
+        self.loudness = None
+        self.trim_start = None
+        self.trim_end = None
+
+    @classmethod
+    def from_info(cls, info: dict, url: str) -> 'Track':
+        """Builds a track from what the resolver returns for a page URL."""
+        return cls(info.get('webpage_url') or url, info['title'], info['duration'], info.get('thumbnail'), info.get('abr'), info['url'])
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'Track':
+        """Restores a track saved with to_dict."""
+        track = cls(values['webpage_url'], values['title'], values.get('duration'), values.get('thumbnail'), values.get('abr'))
+        track.loudness = values.get('loudness')
+        track.trim_start = values.get('trim_start')
+        track.trim_end = values.get('trim_end')
+        return track
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in _SAVED}
+
+    @property
+    def url(self) -> Optional[str]:
+        return self.stream.url if self.stream else None
+
+    @property
+    def expires(self) -> Optional[int]:
+        # Without a stream the track needs resolving right away, which reads as "already expired".
+        return self.stream.expires if self.stream else 0
+
+    @property
+    def analysed(self) -> bool:
+        return self.trim_end is not None
+
+    def set_stream(self, url: str) -> None:
+        self.stream = Stream(url)
+
+    def release_stream(self) -> None:
+        self.stream = None
+
+    def apply_analysis(self, analysis: dict) -> None:
+        self.loudness = analysis.get('loudness')
+        self.trim_start = analysis.get('trim_start')
+        self.trim_end = analysis.get('trim_end')
+
+    def __repr__(self) -> str:
+        return f"<Track {self.title!r} {self.webpage_url}>"
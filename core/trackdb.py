@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+DEFAULT_PATH = 'music_bot.db'
+
+# Per-track metadata, keyed by the page URL a track was resolved from. New columns
+# are added to existing databases on startup, so extend this rather than the table.
+_COLUMNS = {
+    'title': 'TEXT',
+    'duration': 'INTEGER',
+    'loudness': 'REAL',
+    'trim_start': 'REAL',
+    'trim_end': 'REAL',
+    'updated_at': 'REAL',
+}
+
+
+class TrackDatabase:
+    """
+    Stores what we learn about a track once, so it doesn't have to be measured again on every play.
+
+    Args:
+        path (str, optional): The SQLite database file. Defaults to music_bot.db.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS tracks (webpage_url TEXT PRIMARY KEY)")
+            existing = {row['name'] for row in self.conn.execute("PRAGMA table_info(tracks)")}
+            for column, column_type in _COLUMNS.items():
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE tracks ADD COLUMN {column} {column_type}")
+
+    def get(self, webpage_url: str) -> Optional[dict]:
+        """
+        Looks up the stored metadata of a track.
+
+        Args:
+            webpage_url (str): The page URL the track was resolved from.
+
+        Returns:
+            Optional[dict]: The stored columns, or None if the track was never stored.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM tracks WHERE webpage_url = ?", (webpage_url,)).fetchone()
+        return dict(row) if row else None
+
+    def update(self, webpage_url: str, **values) -> None:
+        """
+        Stores metadata of a track, creating its row if needed.
+
+        Args:
+            webpage_url (str): The page URL the track was resolved from.
+            **values: Columns to set, see _COLUMNS.
+        """
+        values['updated_at'] = time.time()
+        columns = ", ".join(values)
+        placeholders = ", ".join("?" for _ in values)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in values)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT INTO tracks (webpage_url, {columns}) VALUES (?, {placeholders}) "
+                f"ON CONFLICT(webpage_url) DO UPDATE SET {updates}",
+                (webpage_url, *values.values())
+            )
+
+    def titles(self):
+        """
+        Lists every track with a known title.
+
+        Returns:
+            list: (webpage_url, title, duration) tuples.
+        """
+        with self.lock:
+            return [tuple(row) for row in self.conn.execute("SELECT webpage_url, title, duration FROM tracks WHERE title IS NOT NULL")]
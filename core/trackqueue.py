@@ -0,0 +1,255 @@
+from itertools import islice
+
+# Blocks are split once they grow past twice this size.
+BLOCK_SIZE = 128
+
+
+class Fenwick:
+    """
+    A binary indexed tree over a list of numbers: prefix sums, point updates, appends
+    and "which entry holds the n-th unit" searches, all in O(log n).
+
+    Args:
+        values (optional): The initial values.
+    """
+
+    def __init__(self, values=()):
+        self.tree = [0]
+        for value in values:
+            self.tree.append(value)
+        # Linear-time build: push every node's total into its parent.
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self) -> int:
+        return len(self.tree) - 1
+
+    def add(self, index: int, delta) -> None:
+        """Adds delta to the value at index."""
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def append(self, value) -> None:
+        # The new node covers the last lowbit(i) values, so it is this value plus the sums already stored for the rest.
+        i = len(self.tree)
+        total = value
+        j = i - 1
+        stop = i - (i & -i)
+        while j > stop:
+            total += self.tree[j]
+            j -= j & -j
+        self.tree.append(total)
+
+    def prefix(self, count: int):
+        """Sums the first count values."""
+        total = 0
+        i = count
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, target) -> tuple:
+        """
+        Finds the value that contains position target when the values are laid end to end.
+
+        Returns:
+            tuple: The index of that value, and target minus the sum of the values before it.
+        """
+        index = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            nxt = index + step
+            if nxt < len(self.tree) and self.tree[nxt] <= target:
+                index = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return index, target
+
+
+class TrackQueue:
+    """
+    A list of tracks stored as a list of small blocks, with a Fenwick tree over the block
+    sizes. Looking up, inserting or removing at any position touches one block plus the
+    tree, so it is O(log n) instead of the O(n) of a deque, and a page of the queue can be
+    read without copying the rest of it.
+
+    Supports the deque operations the player used (append, extend, appendleft, popleft,
+    remove, indexing, iteration) plus positional insert, pop, move and slicing.
+
+    A second Fenwick tree sums a weight per track (its duration, for the player) per block,
+    so the total and the weight of everything ahead of a position stay O(log n) as well.
+
+    Args:
+        items (optional): The initial tracks.
+        weight (optional): Maps a track to its weight. Defaults to 0 for everything.
+    """
+
+    def __init__(self, items=(), weight=None):
+        self.weight = weight or (lambda item: 0)
+        self.blocks = []
+        self.sizes = Fenwick()
+        self.weights = Fenwick()
+        self.length = 0
+        self.extend(items)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __bool__(self) -> bool:
+        return self.length > 0
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def __contains__(self, item) -> bool:
+        return any(item in block for block in self.blocks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step != 1:
+                return list(self)[index]
+            return self.slice(start, stop)
+        block, offset = self._locate(index)
+        return self.blocks[block][offset]
+
+    def _rebuild(self) -> None:
+        self.blocks = [block for block in self.blocks if block]
+        self.sizes = Fenwick(len(block) for block in self.blocks)
+        self.weights = Fenwick(sum(map(self.weight, block)) for block in self.blocks)
+
+    def total_weight(self):
+        """Sums the weight of every track in the queue."""
+        return self.weights.prefix(len(self.blocks))
+
+    def weight_before(self, index: int):
+        """Sums the weight of the tracks ahead of position index."""
+        if index >= self.length:
+            return self.total_weight()
+        block, offset = self._locate(index)
+        return self.weights.prefix(block) + sum(map(self.weight, islice(self.blocks[block], offset)))
+
+    def _normalize(self, index: int) -> int:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("queue index out of range")
+        return index
+
+    def _locate(self, index: int) -> tuple:
+        return self.sizes.find(self._normalize(index))
+
+    def slice(self, start: int, stop: int) -> list:
+        """Copies out tracks start to stop (exclusive), touching only the blocks they live in."""
+        start = max(0, min(start, self.length))
+        stop = max(start, min(stop, self.length))
+        if start == stop:
+            return []
+        block, offset = self.sizes.find(start)
+        result = []
+        wanted = stop - start
+        while len(result) < wanted:
+            result.extend(islice(self.blocks[block], offset, offset + wanted - len(result)))
+            block += 1
+            offset = 0
+        return result
+
+    def append(self, item) -> None:
+        weight = self.weight(item)
+        if not self.blocks or len(self.blocks[-1]) >= BLOCK_SIZE:
+            self.blocks.append([item])
+            self.sizes.append(1)
+            self.weights.append(weight)
+        else:
+            self.blocks[-1].append(item)
+            self.sizes.add(len(self.blocks) - 1, 1)
+            self.weights.add(len(self.blocks) - 1, weight)
+        self.length += 1
+
+    def extend(self, items) -> None:
+        for item in items:
+            self.append(item)
+
+    def appendleft(self, item) -> None:
+        self.insert(0, item)
+
+    def insert(self, index: int, item) -> None:
+        """Inserts a track so that it ends up at position index."""
+        if index < 0:
+            index = max(0, index + self.length)
+        if index >= self.length:
+            self.append(item)
+            return
+        block, offset = self._locate(index)
+        self.blocks[block].insert(offset, item)
+        self.sizes.add(block, 1)
+        self.weights.add(block, self.weight(item))
+        self.length += 1
+        if len(self.blocks[block]) > 2 * BLOCK_SIZE:
+            items = self.blocks[block]
+            self.blocks[block:block + 1] = [items[:BLOCK_SIZE], items[BLOCK_SIZE:]]
+            self._rebuild()
+
+    def insert_many(self, index: int, items) -> None:
+        """Inserts several tracks at once so that the first one ends up at position index."""
+        items = list(items)
+        if index < 0:
+            index = max(0, index + self.length)
+        if index >= self.length:
+            self.extend(items)
+            return
+        block, offset = self._locate(index)
+        head, tail = self.blocks[block][:offset], self.blocks[block][offset:]
+        middle = [items[i:i + BLOCK_SIZE] for i in range(0, len(items), BLOCK_SIZE)]
+        self.blocks[block:block + 1] = [head] + middle + [tail]
+        self.length += len(items)
+        self._rebuild()
+
+    def pop(self, index: int = -1):
+        """Removes and returns the track at position index."""
+        block, offset = self._locate(index)
+        item = self.blocks[block].pop(offset)
+        self.length -= 1
+        if self.blocks[block]:
+            self.sizes.add(block, -1)
+            self.weights.add(block, -self.weight(item))
+        else:
+            del self.blocks[block]
+            self._rebuild()
+        return item
+
+    def popleft(self):
+        if not self.length:
+            raise IndexError("pop from an empty queue")
+        return self.pop(0)
+
+    def index(self, item) -> int:
+        position = 0
+        for block in self.blocks:
+            for offset, candidate in enumerate(block):
+                if candidate is item or candidate == item:
+                    return position + offset
+            position += len(block)
+        raise ValueError("track is not in the queue")
+
+    def remove(self, item) -> None:
+        self.pop(self.index(item))
+
+    def move(self, source: int, destination: int):
+        """Moves the track at position source so it ends up at position destination, and returns it."""
+        destination = self._normalize(destination)
+        item = self.pop(source)
+        self.insert(destination, item)
+        return item
+
+    def clear(self) -> None:
+        self.blocks = []
+        self.sizes = Fenwick()
+        self.weights = Fenwick()
+        self.length = 0
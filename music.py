@@ -1,69 +1,800 @@
 import disnake
 from disnake.ext import commands
-import yt_dlp
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 import os
 from dotenv import load_dotenv
 import asyncio
 import re
-from collections import deque
 from core.statbed import create_alert_embed, create_success_embed, create_critical_failure_embed
 import requests
 import aiohttp
 import concurrent.futures
+import time
+import json
+import sqlite3
+from collections import deque
+from core.streamurl import expires_within, REFRESH_LOOKAHEAD
+from core.playback import TrackedAudio, GainAudio, CrossfadeMixer, FRAME_LENGTH, CROSSFADE_LEAD, RECOVERY_ATTEMPTS, RECOVERY_TIMEOUT
+from core.trackdb import TrackDatabase
+from core.broadcast import hub as broadcasts
+from core.encoding import policy as encoding
+from core.buffering import budget as buffering, ProgressiveDownload
+from core.supervisor import supervisor, AdmissionError
+from core.governor import governor
+from core.analysis import analyse_stream, loudness_gain
+from core import resolver as resolution
+from core.mailbox import Mailbox
+from core.tieredqueue import TieredQueue, QueueStore
+from core.playbackstate import PlaybackStateStore
+from core.track import Track, STREAM_WINDOW
+from core.searches import PendingSearches
+from core.titleindex import TitleIndex
+
+# Where playback state was kept before it moved to PlaybackStateStore; migrated on startup.
+PLAYBACK_STATE_FILE = os.path.join('databases', 'playback_state.json')
+
+# Streams get extra read-ahead for this long (seconds) after a stall or dropped connection.
+UNHEALTHY_PERIOD = 600
+
+# Recoveries of the same track that get less than this far (seconds) past the last one count as
+# one streak; a streak longer than RECOVERY_ATTEMPTS gives up on the track.
+RECOVERY_PROGRESS = 10
+
+# How many of a search's top results are resolved in the background while the user is still choosing.
+SPECULATIVE_RESULTS = 3
+
+# How many playlist entries go to the resolver in one batch; the progress message updates once per batch.
+PLAYLIST_BATCH = 10
+
+# How many finished songs each guild remembers for the previous button, unless HISTORY_SIZE says otherwise.
+HISTORY_SIZE = 20
 
 # Remove logging setup
 # logging.basicConfig(filename='music_bot.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-async def update_status(self):
-    if self.current_song:
-        await self.bot.change_presence(activity=disnake.Activity(type=disnake.ActivityType.listening, name=self.current_song['title']))
-    else:
-        await self.bot.change_presence(activity=None)
+def track_duration(track):
+    return track.duration
 
-class Music(commands.Cog):
-    def __init__(self, bot):
-        self.bot = bot
-        self.song_queue = deque()
+class GuildPlayer:
+    """
+    One guild's queue and playback. Commands, buttons and the playback loop never change it
+    directly: they post to its mailbox, and a single task applies the changes one at a time,
+    so two /play calls can't both start a track. Each guild has its own mailbox, so guilds
+    never wait on each other.
+    """
+
+    def __init__(self, cog, guild):
+        self.cog = cog
+        self.bot = cog.bot
+        self.guild = guild
+        # Only the head of the queue is kept in memory; the rest waits in SQLite until it comes up.
+        self.song_queue = TieredQueue(cog.queue_store, guild.id, weight=track_duration, dump=Track.to_dict, load=Track.from_dict)
         self.current_song = None
         self.is_playing = False
         self.volume = 1.0
         self.repeat = False
+        # Repeat-queue: finished songs go back onto the end of the queue, resolved streams and all.
+        self.loop_queue = False
+        self.loop_start = None
+        self.loops = 0
+        self.refreshes = 0
+        self.loop_mark = 0
+        self.loop_refreshes = deque(maxlen=10)
         self.dashboard_message = None
         self.dashboard_channel = None
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=6)
-        
-        load_dotenv()
-        self.spotify_client_id = os.getenv('SPOTIFY_CLIENT_ID')
-        self.spotify_client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
-        self.youtube_api_key = os.getenv('YOUTUBE_API_KEY')
+        self.current_source = None
+        self.recoveries = 0
+        self.last_recovery = None
+        self.last_recovery_at = None
+        self.recovery_song = None
+        self.recovery_position = 0
+        self.recovery_streak = 0
+        self.crossfade = 0
+        self.mixer = None
+        self.mixer_song = None
+        self.mailbox = Mailbox(f"guild {guild.id} player")
+        # Finished songs, newest last. They keep their resolved stream, so going back doesn't have to
+        # extract them again unless the URL has expired since.
+        self.history = deque(maxlen=cog.history_size)
+        self.tick_pending = False
+
+    async def submit(self, func, *args, **kwargs):
+        """Runs one of this player's methods on its mailbox and returns the result."""
+        return await self.mailbox.submit(func, *args, **kwargs)
+
+    def post_tick(self):
+        # A slow tick (a recovery, say) shouldn't pile up more ticks behind it.
+        if not self.tick_pending:
+            self.tick_pending = True
+            self.mailbox.post(self.tick)
+
+    async def tick(self):
+        try:
+            voice_client = self.guild.voice_client
+            if self.is_playing and voice_client:
+                if self.mixer_song and self.mixer.current is not self.current_source:
+                    await self.finish_crossfade()
+                elif self.mixer and voice_client.is_playing():
+                    await self.prepare_crossfade()
+                source = self.current_source
+                if source and voice_client.is_playing() and source.stalled():
+                    await self.recover_playback("stalled")
+                elif not voice_client.is_playing():
+                    if source and self.current_song and source.ended_early(self.track_end(self.current_song)):
+                        await self.recover_playback("ended early")
+                    else:
+                        await self.play_next()
+        except Exception as e:
+            print(f"Error in playback of guild {self.guild.id}: {e}")
+        finally:
+            self.tick_pending = False
+
+    def remaining(self):
+        # What's left of the current song.
+        if not self.current_song:
+            return 0
+        position = self.current_source.position if self.current_source else 0
+        return max(0, self.track_end(self.current_song) - position)
+
+    def eta(self, position):
+        """Seconds until the song at a queue position starts, O(log n)."""
+        return self.remaining() + self.song_queue.weight_before(position)
+
+    def total_remaining(self):
+        return self.remaining() + self.song_queue.total_weight()
+
+    def disposable(self):
+        # Nothing left worth keeping around once we're out of voice with nothing queued.
+        return not self.guild.voice_client and not self.song_queue and not self.current_song and self.mailbox.idle
+
+    async def enqueue(self, tracks, position=None):
+        start = len(self.song_queue) if position is None else min(position, len(self.song_queue))
+        for offset, track in enumerate(tracks):
+            # Stream URLs are the bulk of a track; far-off ones are re-resolved as they come up.
+            if start + offset >= STREAM_WINDOW:
+                track.release_stream()
+        if position is None:
+            self.song_queue.extend(tracks)
+        else:
+            self.song_queue.insert_many(position, tracks)
+        if not self.is_playing:
+            await self.play_next()
+        await self.update_dashboard()
+
+    async def remove(self, position):
+        if not 0 <= position < len(self.song_queue):
+            return None
+        track = self.song_queue.pop(position)
+        await self.update_dashboard()
+        return track
+
+    async def move(self, source, destination):
+        if not (0 <= source < len(self.song_queue) and 0 <= destination < len(self.song_queue)):
+            return None
+        track = self.song_queue.move(source, destination)
+        await self.update_dashboard()
+        return track
 
-        if self.spotify_client_id and self.spotify_client_secret:
+    async def shuffle(self):
+        if len(self.song_queue) < 2:
+            return False
+        self.song_queue.shuffle()
+        await self.update_dashboard()
+        return True
+
+    async def dedupe(self):
+        removed = self.song_queue.dedupe(lambda track: track.webpage_url)
+        if removed:
+            await self.update_dashboard()
+        return removed
+
+    async def clear_queue(self):
+        count = len(self.song_queue)
+        self.song_queue.clear()
+        await self.update_dashboard()
+        return count
+
+    async def recover_playback(self, reason):
+        song = self.current_song
+        position = self.current_source.position
+        print(f"Playback {reason} in {song.title} at {position:.1f}s, recovering...")
+        # Kill the dead FFmpeg so the voice player thread isn't left blocked on its pipe.
+        self.current_source.cleanup()
+        started = self.last_recovery_at = time.monotonic()
+        # A stream that opens fine but never plays anything "recovers" on every tick without a single
+        # attempt failing, so the attempts are also counted across ticks.
+        if song is self.recovery_song and position - self.recovery_position < RECOVERY_PROGRESS:
+            self.recovery_streak += 1
+        else:
+            self.recovery_song = song
+            self.recovery_streak = 1
+        self.recovery_position = position
+        if self.recovery_streak > RECOVERY_ATTEMPTS:
+            self.last_recovery = f"{reason} at {self.cog.format_duration(position)}, gave up after {RECOVERY_ATTEMPTS} recoveries without progress"
+            print(f"Giving up on {song.title}: {RECOVERY_ATTEMPTS} recoveries at {position:.1f}s got nowhere")
+            self.current_source = None
+            await self.play_next()
+            return False
+        for attempt in range(RECOVERY_ATTEMPTS):
             try:
-                self.spotify = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-                    client_id=self.spotify_client_id,
-                    client_secret=self.spotify_client_secret
-                ))
-                print("Spotify client initialized successfully")
+                await asyncio.wait_for(self.refresh(song), timeout=RECOVERY_TIMEOUT)
+                await asyncio.wait_for(self.play_song(song, start=position), timeout=RECOVERY_TIMEOUT)
             except Exception as e:
-                print(f"Error initializing Spotify client: {e}")
-                self.spotify = None
+                print(f"Recovery attempt {attempt + 1}/{RECOVERY_ATTEMPTS} failed: {e}")
+                continue
+            elapsed = time.monotonic() - started
+            self.recoveries += 1
+            self.last_recovery = f"{reason} at {self.cog.format_duration(position)}, recovered in {elapsed:.1f}s"
+            print(f"Recovered {song.title} at {position:.1f}s in {elapsed:.1f}s")
+            return True
+        elapsed = time.monotonic() - started
+        self.last_recovery = f"{reason} at {self.cog.format_duration(position)}, gave up after {elapsed:.1f}s"
+        print(f"Giving up on {song.title} after {elapsed:.1f}s")
+        self.current_source = None
+        await self.play_next()
+        return False
+
+    def playback_state(self):
+        # Stream URLs won't survive a restart anyway, so only the page URLs are kept;
+        # restored tracks have no stream, so the refresher re-resolves them once we are back up.
+        # Only the in-memory part of the queue is here; the cog saves the spilled tail separately.
+        if not self.current_song or not self.guild.voice_client:
+            return None
+        return {
+            'channel_id': self.guild.voice_client.channel.id,
+            'song': self.current_song.to_dict(),
+            'position': self.current_source.position if self.current_source else 0,
+            'queue': [track.to_dict() for track in self.song_queue.slice(0, len(self.song_queue) - self.song_queue.spilled)]
+        }
+
+    async def resume(self, channel, state, tail=()):
+        # tail: the rest of the queue after state['queue'], in pages of track dicts.
+        tracks = []
+        for values in [state['song']] + state['queue']:
+            if isinstance(values.get('duration'), str):
+                # Saved before durations were stored as seconds.
+                values['duration'] = self.cog.parse_duration(values['duration'])
+            tracks.append(Track.from_dict(values))
+        await channel.connect()
+        self.song_queue.extend(tracks[1:])
+        for page in tail:
+            self.song_queue.extend(Track.from_dict(values) for values in page)
+        self.current_song = tracks[0]
+        self.is_playing = True
+        await self.play_song(self.current_song, start=state['position'])
+        print(f"Resumed {self.current_song.title} at {state['position']:.1f}s with {len(self.song_queue)} queued in {self.guild.name}")
+
+    async def refresh_expiring_tracks(self):
+        # Walk the queue in play order, so the entries closest to the head are
+        # re-resolved first, and stop once we are past the refresh lookahead.
+        now = time.time()
+        eta = self.remaining()
+        position = 0
+        # Indexed one entry at a time rather than copied, since the queue can change while we await a refresh.
+        while eta <= REFRESH_LOOKAHEAD and position < len(self.song_queue):
+            track = self.song_queue[position]
+            length = track_duration(track)
+            if expires_within(track, eta + length, now):
+                await self.refresh(track)
+            eta += length
+            position += 1
+
+    async def refresh(self, track):
+        # Counted, so /debug can show how many re-resolutions each pass of a looping queue costs.
+        self.refreshes += 1
+        return await self.cog.refresh_stream_url(track)
+
+    def recycle(self, song):
+        # Nothing is resolved again here: the track keeps its metadata and analysis, and its stream
+        # is only refreshed by the usual lookahead once it is about to expire.
+        self.song_queue.append(song)
+
+    def count_loop(self, song):
+        # A pass is over when the song it started with comes round again.
+        if not self.loop_queue:
+            return
+        if self.loop_start is None:
+            self.loop_start = song.webpage_url
+            self.loop_mark = self.refreshes
+        elif song.webpage_url == self.loop_start:
+            self.loops += 1
+            self.loop_refreshes.append(self.refreshes - self.loop_mark)
+            self.loop_mark = self.refreshes
+
+    async def play_next(self):
+        if self.repeat and self.current_song:
+            # If repeat is enabled, re-play the current song
+            try:
+                await self.play_song(self.current_song)
+            except AdmissionError as e:
+                print(f"Couldn't restart {self.current_song.title}: {e}")
+            except Exception as e:
+                # Retrying it every tick would never get anywhere; drop it and move on to the queue,
+                # as when a queued song fails to start.
+                print(f"Couldn't restart {self.current_song.title}, skipping it: {e}")
+                self.current_song = None
+                self.current_source = None
         else:
-            self.spotify = None
+            if self.current_song:
+                self.history.append(self.current_song)
+                if self.loop_queue:
+                    self.recycle(self.current_song)
+            if not self.song_queue:
+                self.current_song = None
+                self.current_source = None
+                self.mixer = None
+                self.mixer_song = None
+                self.is_playing = False
+                await self.update_dashboard()
+                return
+
+            self.current_song = self.song_queue.popleft()
+            self.count_loop(self.current_song)
+            self.is_playing = True
+            try:
+                await self.play_song(self.current_song)
+            except AdmissionError as e:
+                # Put it back; the playback loop keeps retrying while is_playing is set.
+                print(f"Couldn't start {self.current_song.title}: {e}")
+                self.song_queue.appendleft(self.current_song)
+                self.current_song = None
+                self.current_source = None
+                return
+            except Exception as e:
+                # Drop it. Without a source the next tick moves on, rather than mistaking the previous
+                # track's finished source for this one ending early.
+                print(f"Couldn't start {self.current_song.title}, skipping it: {e}")
+                self.current_song = None
+                self.current_source = None
+                return
+            if self.song_queue:
+                # Analyse what's up next while this one plays, so it already starts trimmed.
+                self.cog.load_analysis(self.song_queue[0], self.guild.id)
+            await self.update_dashboard()
+
+    async def play_song(self, song, start=0):
+        voice_client = self.guild.voice_client
+        bitrate = encoding.bitrate_for(voice_client.channel)
+        self.current_source = await self.create_source(song, start, bitrate)
+        if self.crossfade and not self.repeat:
+            self.mixer = CrossfadeMixer(self.current_source, int(self.crossfade / FRAME_LENGTH))
+        else:
+            self.mixer = None
+        # Whatever a previous mixer was fading into is gone with it.
+        self.mixer_song = None
+
+        # Only stop the old source once the new one is ready, so the playback loop never sees a gap to advance on.
+        if voice_client.is_playing() or voice_client.is_paused():
+            voice_client.stop()
+        voice_client.play(self.mixer or self.current_source)
+        # PCM sources are encoded by the voice client itself; match it to the channel too.
+        encoding.configure(voice_client.encoder, bitrate)
+        self.is_playing = True  # Ensure the bot knows it's playing
+
+    async def create_source(self, song, start=0, bitrate=None):
+        if bitrate is None:
+            bitrate = encoding.bitrate_for(self.guild.voice_client.channel)
+        if expires_within(song, track_duration(song)):
+            # The background refresher has not reached this one yet (or it was queued too far back
+            # to keep a stream); resolve it just in time.
+            await self.refresh(song)
+        self.cog.load_analysis(song, self.guild.id)
+        # Seeks and recoveries start past what a fresh download would have on disk for a while.
+        resuming = start > 0
+        # Skip leading dead air, and stop reading the input where the real audio ends.
+        start = max(start, song.trim_start or 0)
+        end = song.trim_end
+        # A player with its own volume or crossfade needs its own pipeline; everyone else can share one.
+        shared = self.volume == 1.0 and not self.crossfade
+        source_url = song.url
+        download = None
+        if self.cog.disk_buffering and not shared and not resuming:
+            # Read-ahead goes to a temp file instead of memory; shared streams stay on HTTP since
+            # the file's lifetime is tied to a single player, and so do seeks and recoveries, which
+            # FFmpeg would otherwise have to wait on the download for.
+            download = ProgressiveDownload(song.url)
+            download.start()
+            source_url = download.input
+            before_options = download.before_options
+        else:
+            before_options = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+        if start > 0:
+            # Input-side seek, so FFmpeg jumps straight there instead of decoding from the start.
+            before_options += f' -ss {start:.2f}'
+        if end and end > start:
+            before_options += f' -t {end - start:.2f}'
+        options = '-vn'
+        normalization = loudness_gain(song.loudness)
+        if normalization != 1.0 or not shared:
+            # Decoding to PCM and encoding Opus ourselves costs CPU, so only do it when there is a gain to apply
+            # or tracks to blend.
+            def make_source():
+                return GainAudio(disnake.FFmpegPCMAudio(source_url, before_options=before_options, options=options), volume=self.volume, normalization=normalization)
+        else:
+            if song.codec is None:
+                # Probe once per track; seeks and recoveries reuse the result instead of paying for ffprobe again.
+                song.codec, _ = await disnake.FFmpegOpusAudio.probe(song.url)
+            # Pass Opus through when it already fits the channel, otherwise encode at the channel's bitrate.
+            codec, encoder_options = encoding.opus_output(song.codec, song.abr, bitrate)
+
+            def make_source():
+                return disnake.FFmpegOpusAudio(source_url, codec=codec, bitrate=bitrate, before_options=before_options, options=f'{options} {encoder_options}')
+
+        key = (song.webpage_url, start, end, bitrate)
+        if not (shared and broadcasts.joinable(key)):
+            try:
+                await supervisor.admit()
+            except AdmissionError:
+                if download:
+                    download.close()
+                raise
+        if shared:
+            # Guilds starting the same track within a few seconds of each other get one FFmpeg and encoder between them.
+            audio_source = broadcasts.subscribe(key, make_source, bitrate)
+        else:
+            audio_source = make_source()
+        unhealthy = self.last_recovery_at is not None and time.monotonic() - self.last_recovery_at < UNHEALTHY_PERIOD
+        buffering.apply(audio_source, unhealthy)
+        tracked = TrackedAudio(audio_source, start=start, on_cleanup=download.close if download else None)
+        # A shared FFmpeg lives as long as its broadcast, a private one as long as this player's source.
+        supervisor.register_source(audio_source, self.guild.id, audio_source.broadcast if shared else tracked)
+        return tracked
+
+    async def prepare_crossfade(self):
+        # Spawn the next track's decoder just before the overlap window, and hand it to the mixer
+        # with the exact number of frames to wait, so the fade starts on time despite the 1s polling.
+        if not self.mixer or not self.crossfade or self.mixer.incoming or self.repeat or not self.song_queue:
+            return
+        remaining = self.track_end(self.current_song) - self.current_source.position
+        if remaining > self.crossfade + CROSSFADE_LEAD:
+            return
+        song = self.song_queue[0]
+        try:
+            source = await self.create_source(song)
+        except Exception as e:
+            print(f"Error preparing crossfade into {song.title}: {e}")
+            return
+        remaining = self.track_end(self.current_song) - self.current_source.position
+        self.mixer_song = song
+        self.mixer.crossfade_to(source, int(max(0, remaining - self.crossfade) / FRAME_LENGTH))
+
+    async def finish_crossfade(self):
+        # The mixer has moved on to the next track by itself; catch the queue up with it.
+        if self.mixer_song in self.song_queue:
+            self.song_queue.remove(self.mixer_song)
+        if self.current_song:
+            self.history.append(self.current_song)
+            if self.loop_queue:
+                self.recycle(self.current_song)
+        self.current_song = self.mixer_song
+        self.count_loop(self.current_song)
+        self.current_source = self.mixer.current
+        self.mixer_song = None
+        await self.update_dashboard()
+        if self.song_queue:
+            self.cog.load_analysis(self.song_queue[0], self.guild.id)
+
+
+    def track_end(self, song):
+        return song.trim_end or track_duration(song)
+
+    async def apply_volume(self):
+        if not self.current_song or not self.current_source:
+            return
+        if isinstance(self.current_source.original, GainAudio):
+            self.current_source.original.volume = self.volume
+            if self.mixer and self.mixer.incoming:
+                self.mixer.incoming.original.volume = self.volume
+        elif self.volume != 1.0:
+            # The Opus passthrough has no gain stage; switch this track over to the PCM path once.
+            await self.play_song(self.current_song, start=self.current_source.position)
+
+    async def change_volume(self, step):
+        self.volume = round(max(0.0, min(2.0, self.volume + step)), 1)
+        await self.apply_volume()
+
+    async def set_crossfade(self, seconds):
+        self.crossfade = seconds
+        await self.update_dashboard()
+
+    async def toggle_repeat(self):
+        # Cycles off, the current song, the whole queue.
+        if self.repeat:
+            self.repeat = False
+            self.loop_queue = True
+            self.loop_start = None
+        elif self.loop_queue:
+            self.loop_queue = False
+        else:
+            self.repeat = True
+
+    def repeat_mode(self):
+        if self.repeat:
+            return "Song"
+        return "Queue" if self.loop_queue else "Off"
+
+    async def toggle_pause(self):
+        voice_client = self.guild.voice_client
+        if not voice_client:
+            return
+        if voice_client.is_playing():
+            voice_client.pause()
+            self.is_playing = False
+        else:
+            voice_client.resume()
+            self.is_playing = True
+            if self.current_source:
+                self.current_source.reset_stall_timer()
+
+    async def skip(self):
+        voice_client = self.guild.voice_client
+        if not voice_client or not voice_client.is_playing():
+            return False
+        voice_client.stop()
+        await self.play_next()
+        return True
+
+    async def previous(self):
+        # The song we leave goes back to the front of the queue, so skipping returns to it.
+        if not self.history or not self.guild.voice_client:
+            return None
+        song = self.history.pop()
+        leaving, was_playing = self.current_song, self.is_playing
+        recycled = None
+        if self.loop_queue and self.song_queue and self.song_queue[-1].webpage_url == song.webpage_url:
+            # It was recycled when it finished; it's playing now instead.
+            recycled = self.song_queue.pop()
+        if leaving:
+            self.song_queue.appendleft(leaving)
+        self.current_song = song
+        self.is_playing = True
+        try:
+            await self.play_song(song)
+        except Exception as e:
+            # Refused, or its stream couldn't be opened: the song we were leaving is still playing,
+            # so put everything back the way it was.
+            print(f"Couldn't go back to {song.title}: {e}")
+            if leaving:
+                self.song_queue.popleft()
+            if recycled:
+                self.song_queue.append(recycled)
+            self.current_song, self.is_playing = leaving, was_playing
+            self.history.append(song)
+            return None
+        await self.update_dashboard()
+        return song
+
+    async def seek(self, seconds):
+        if not self.current_song or not self.current_source or not self.guild.voice_client:
+            return False
+        await self.play_song(self.current_song, start=seconds)
+        return True
+
+    def create_dashboard_embed(self):
+        embed = self.cog.create_embed("Music Dashboard", "", disnake.Color.blue(), song=self.current_song)
+        if self.current_song:
+            embed.add_field(name="Now Playing", value=f"🎵 {self.current_song.title} ({self.cog.format_duration(self.current_song.duration)})", inline=False)
+        else:
+            embed.add_field(name="Now Playing", value="Nothing is currently playing", inline=False)
+        embed.add_field(name="Volume", value=f"{int(self.volume * 100)}%", inline=True)
+        embed.add_field(name="Repeat", value=self.repeat_mode(), inline=True)
+        embed.add_field(name="Crossfade", value=f"{self.crossfade}s" if self.crossfade else "Off", inline=True)
+        embed.add_field(name="Queue", value=f"{len(self.song_queue)} songs, {self.cog.format_duration(self.total_remaining())} left", inline=True)
+        embed.set_thumbnail(url=self.bot.user.avatar.url)
+        return embed
+
+    def create_dashboard_components(self):
+        play_pause_style = disnake.ButtonStyle.secondary if self.is_playing else disnake.ButtonStyle.success
+        play_pause_emoji = "<:Pause:1262673070854901770>" if self.is_playing else "<:Play:1262672920984027157>"
+        repeat_style = disnake.ButtonStyle.secondary if self.repeat or self.loop_queue else disnake.ButtonStyle.primary
+        return [
+            disnake.ui.Button(style=disnake.ButtonStyle.primary, emoji="<:VolDown:1262671144910061650>", custom_id="music_volume_down"),
+            disnake.ui.Button(style=disnake.ButtonStyle.primary, emoji="<:PreviousTrack:1262671148525682760>", custom_id="music_previous"),
+            disnake.ui.Button(style=play_pause_style, emoji=play_pause_emoji, custom_id="music_play_pause"),
+
+            disnake.ui.Button(style=disnake.ButtonStyle.primary, emoji="<:NextTrack:1262671150291353625>", custom_id="music_skip"),
+            disnake.ui.Button(style=disnake.ButtonStyle.primary, emoji="<:VolUp:1262671143890976798>", custom_id="music_volume_up"),
+            disnake.ui.Button(style=disnake.ButtonStyle.secondary,label="-", disabled=True, custom_id="button_disabled2"),
+            disnake.ui.Button(style=repeat_style, emoji="<:RepeatOne:1262671948140384298>", custom_id="music_repeat"),
+            disnake.ui.Button(style=disnake.ButtonStyle.success, emoji="<:AddToList:1262671146491445249>", custom_id="music_add_to_playlist"),
+            disnake.ui.Button(style=disnake.ButtonStyle.primary, emoji="<:Queue:1262673071626522644>", custom_id="music_view_queue"),
+            disnake.ui.Button(style=disnake.ButtonStyle.secondary,label="-", disabled=True, custom_id="button_disabled")
+        ]
+
+    async def update_dashboard(self):
+        if self.dashboard_message and self.dashboard_channel:
+            embed = self.create_dashboard_embed()
+            components = self.create_dashboard_components()
+            try:
+                await self.dashboard_message.edit(embed=embed, components=components)
+            except disnake.NotFound:
+                # If the message was deleted, reset the dashboard
+                self.dashboard_message = None
+                self.dashboard_channel = None
+
+class Music(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.players = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=6)
+        self.pending_refreshes = {}
+        self.track_db = TrackDatabase()
+        # Sharded workers each spill into their own file rather than contending for one.
+        shard_ids = getattr(bot, 'shard_ids', None)
+        self.queue_store = QueueStore(os.path.join('databases', f'queue_spill.{shard_ids[0]}.db' if shard_ids else 'queue_spill.db'))
+        self.state_store = PlaybackStateStore()
+        # Guilds whose row in the state store this process wrote, so it can drop them once they stop,
+        # with the version of the queue tail saved for each, so a tail is only copied again once it changes.
+        self.saved_guilds = {}
+        # What the bot's presence says it is listening to.
+        self.presence = None
+        self.searches = PendingSearches()
+        # Everything we have resolved before, for /play's autocomplete.
+        self.title_index = TitleIndex()
+        for webpage_url, title, duration in self.track_db.titles():
+            self.title_index.add(webpage_url, title, duration or 0)
+        self.pending_analyses = set()
+        self.analysis_semaphore = asyncio.Semaphore(2)
+        
+        load_dotenv()
+        self.youtube_api_key = os.getenv('YOUTUBE_API_KEY')
+        self.disk_buffering = os.getenv('DISK_BUFFERING', '').lower() in ('1', 'true', 'yes')
+        self.history_size = int(os.getenv('HISTORY_SIZE', HISTORY_SIZE))
+        # Set by the sharded launcher, or a standalone `python -m core.resolver` whose warm caches
+        # survive bot restarts. Without either, everything is resolved in-process.
+        resolver_socket = os.getenv('RESOLVER_SOCKET')
+        if not resolver_socket and resolution.service_running():
+            resolver_socket = resolution.DEFAULT_SOCKET
+        self.resolver = resolution.ResolverClient(resolver_socket) if resolver_socket else None
+        self.spotify = resolution.create_spotify_client()
 
         self.bot.loop.create_task(self.start_playback_loop())  # Start the playback loop
 
+    def get_player(self, guild):
+        player = self.players.get(guild.id)
+        if player is None:
+            player = self.players[guild.id] = GuildPlayer(self, guild)
+        return player
+
     async def start_playback_loop(self):
         await self.bot.wait_until_ready()
+        try:
+            await self.resume_playback_state()
+        except Exception as e:
+            print(f"Error resuming playback state: {e}")
         self.bot.loop.create_task(self.playback_loop())
+        self.bot.loop.create_task(governor.probe_lag())
+        self.bot.loop.create_task(self.stream_refresh_loop())
 
     async def playback_loop(self):
+        ticks = 0
         while not self.bot.is_closed():
-            if self.is_playing and not self.bot.voice_clients[0].is_playing():
-                await self.play_next()
+            ticks += 1
+            if ticks % 10 == 0:
+                self.save_playback_state()
+                self.searches.expire()
+            if ticks % 5 == 0:
+                await self.update_status()
+                supervisor.sample()
+                supervisor.reap()
+            if ticks % 5 == 0 and governor.sample():
+                state = "Entering" if governor.degraded else "Leaving"
+                print(f"{state} degraded mode ({governor.describe()}), encoder complexity now {encoding.complexity}")
+                for voice_client in self.bot.voice_clients:
+                    if voice_client.encoder:
+                        encoding.configure(voice_client.encoder, encoding.bitrate_for(voice_client.channel))
+            # Each player checks itself on its own mailbox, so a guild that is busy recovering a stream
+            # doesn't hold up anyone else.
+            for guild_id, player in list(self.players.items()):
+                if player.disposable():
+                    player.mailbox.close()
+                    del self.players[guild_id]
+                else:
+                    player.post_tick()
             await asyncio.sleep(1)  # Check every second
 
+    async def update_status(self):
+        # The presence is the whole bot's, so it is set here from every player at once rather than by
+        # each player as its song changes, and only when it would actually change.
+        playing = [player.current_song for player in self.players.values() if player.current_song]
+        if len(playing) == 1:
+            name = playing[0].title
+        elif playing:
+            name = f"music in {len(playing)} servers"
+        else:
+            name = None
+        if name == self.presence:
+            return
+        self.presence = name
+        activity = disnake.Activity(type=disnake.ActivityType.listening, name=name) if name else None
+        try:
+            await self.bot.change_presence(activity=activity)
+        except Exception as e:
+            print(f"Error updating status: {e}")
+
+    def save_playback_state(self):
+        states = {}
+        tails = {}
+        for guild_id, player in self.players.items():
+            state = player.playback_state()
+            if not state:
+                continue
+            states[guild_id] = state
+            if self.saved_guilds.get(guild_id) != player.song_queue.version:
+                tails[guild_id] = player.song_queue.spilled_pages()
+        try:
+            self.state_store.save(states, self.saved_guilds.keys() - states.keys(), tails)
+        except sqlite3.Error as e:
+            print(f"Error saving playback state: {e}")
+            return
+        self.saved_guilds = {guild_id: self.players[guild_id].song_queue.version for guild_id in states}
+
+    def migrate_playback_state(self):
+        # Moves the old single JSON file into the state store. Files written before players were
+        # per guild hold a single player's state, without a guild id.
+        try:
+            with open(PLAYBACK_STATE_FILE) as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            # Another worker moved it first.
+            return
+        states = {}
+        for state in state.get('players', []) if 'channel_id' not in state else [state]:
+            channel = self.bot.get_channel(state['channel_id'])
+            guild_id = state.get('guild_id') or (channel.guild.id if channel else None)
+            if guild_id:
+                states[guild_id] = state
+        self.state_store.save(states)
+        try:
+            os.remove(PLAYBACK_STATE_FILE)
+        except FileNotFoundError:
+            pass
+
+    async def resume_playback_state(self):
+        if os.path.exists(PLAYBACK_STATE_FILE):
+            self.migrate_playback_state()
+        for guild_id, state in self.state_store.load().items():
+            channel = self.bot.get_channel(state['channel_id'])
+            if not channel:
+                # Another worker's guild.
+                continue
+            # Ours from now on; if it doesn't resume, the next save drops its row.
+            self.saved_guilds[guild_id] = None
+            player = self.get_player(channel.guild)
+            try:
+                await player.submit(player.resume, channel, state, self.state_store.tail(guild_id))
+            except Exception as e:
+                print(f"Error resuming playback in {channel.guild.name}: {e}")
+
+    async def stream_refresh_loop(self):
+        while not self.bot.is_closed():
+            for player in list(self.players.values()):
+                try:
+                    await player.refresh_expiring_tracks()
+                except asyncio.CancelledError:
+                    # A refresh cancelled from elsewhere; only cancelling this loop itself stops it.
+                    if asyncio.current_task().cancelling():
+                        raise
+                    print("Refreshing stream URLs was cancelled, carrying on")
+                except Exception as e:
+                    print(f"Error refreshing stream URLs: {e}")
+            await asyncio.sleep(60)  # Check every minute
+
+    async def refresh_stream_url(self, track):
+        # The refresher and play_song can race on the head of the queue; share one extraction.
+        key = track.webpage_url
+        task = self.pending_refreshes.get(key)
+        if task is None:
+            task = self.pending_refreshes[key] = asyncio.ensure_future(self.extract_info(key, fresh=True))
+            task.add_done_callback(lambda _: self.pending_refreshes.pop(key, None))
+        # Shielded, so a waiter that gives up (a recovery timing out) doesn't cancel it for the others.
+        info = await asyncio.shield(task)
+        if not info:
+            print(f"Failed to refresh stream URL for: {track.title}")
+            return False
+        track.set_stream(info['url'])
+        print(f"Refreshed stream URL for: {track.title}")
+        return True
+
     async def join_voice_channel(self, inter):
         if not inter.author.voice:
             return await create_alert_embed("Join a voice channel first")
@@ -72,21 +803,26 @@ class Music(commands.Cog):
             if inter.guild.voice_client.channel != inter.author.voice.channel:
                 await inter.guild.voice_client.move_to(inter.author.voice.channel)
             return True
+
+        if governor.degraded:
+            # Keep the audio stable for people already listening rather than take on another session.
+            return await create_alert_embed("WACA-Chan is Busy", f"The host is under heavy load right now. Please try again in about {self.format_duration(governor.eta())}.")
         
         await inter.author.voice.channel.connect()
         return True
     
-    async def handle_query(self, inter, query):
-        if 'open.spotify.com' in query:
+    async def handle_query(self, inter, query, position=None):
+        kind = resolution.classify_query(query)
+        if kind == 'spotify':
             return await self.handle_spotify_query(inter, query)
-        elif 'youtube.com/playlist' in query or ('youtube.com/watch?v=' in query and '&list=' in query):
+        elif kind == 'youtube_playlist':
             return await self.handle_youtube_playlist_query(inter, query)
-        elif re.match(r'^(https?:\/\/)?(www\.)?(youtube\.com|youtu\.?be)\/.+$', query):
+        elif kind == 'youtube':
             return await self.handle_youtube_query(inter, query)
-        elif 'soundcloud.com' in query:
+        elif kind == 'soundcloud':
             return await self.handle_soundcloud_query(inter, query)
         else:
-            return await self.handle_search_query(inter, query)
+            return await self.handle_search_query(inter, query, position)
 
     async def handle_spotify_query(self, inter, query):
         tracks = await self.get_spotify_tracks(query)
@@ -119,7 +855,7 @@ class Music(commands.Cog):
     async def handle_soundcloud_query(self, inter, query):
         track = await self.process_soundcloud_url(query)
         if track:
-            embed = await create_success_embed("Added to Queue", f"🎵 {track['title']} ({track['duration']})")
+            embed = await create_success_embed("Added to Queue", f"🎵 {track.title} ({self.format_duration(track.duration)})")
             await inter.edit_original_response(embed=embed)  # Send the embed
             return [track]
         else:
@@ -127,7 +863,7 @@ class Music(commands.Cog):
             await inter.edit_original_response(embed=embed)
             return []
 
-    async def handle_search_query(self, inter, query):
+    async def handle_search_query(self, inter, query, position=None):
         search_results = await self.search_youtube(query)
         if isinstance(search_results, disnake.Embed):
             await inter.edit_original_response(embed=search_results)
@@ -138,40 +874,85 @@ class Music(commands.Cog):
             return []
 
         search_results = search_results[:5]
-        view = SongChoiceView(self, search_results, inter.author.id)
-        embed = self.create_embed("Search Results", "Please select a song from the menu below:", disnake.Color.blue())
+        # Nothing waits on the menu: the pick arrives in on_dropdown, which finds this search by its token.
+        token, search = self.searches.add([result['url'] for result in search_results], inter.author.id, position)
+        if not governor.degraded:
+            # Start on the likely picks right away, so choosing one doesn't wait on an extraction.
+            for index in range(min(SPECULATIVE_RESULTS, len(search_results))):
+                search.resolve(index, self.process_youtube_url)
+        embed = self.create_embed("Search Results", "Please select a song from the menu below:", disnake.Color.blue(), song=self.get_player(inter.guild).current_song)
         if len(search_results) == 5:
             embed.set_footer(text="Showing first 5 results")
 
-        await inter.edit_original_response(embed=embed, view=view)
-        await view.wait()
-        if view.selected_song:
-            track = await self.process_youtube_url(view.selected_song['url'])
-            if track:
-                return [track]
+        await inter.edit_original_response(embed=embed, components=[SongChoiceSelect(search_results, token)])
         return []
 
+    @commands.Cog.listener()
+    async def on_dropdown(self, inter: disnake.MessageInteraction):
+        if not inter.component.custom_id.startswith("search_"):
+            return
+        token = inter.component.custom_id[len("search_"):]
+        search = self.searches.get(token)
+        if search is None:
+            embed = await create_alert_embed("Search Expired", "This search has expired. Please use /play again.")
+            await inter.response.send_message(embed=embed, ephemeral=True)
+            return
+        if inter.author.id != search.author_id:
+            await inter.response.send_message("You didn't initiate this search.", ephemeral=True)
+            return
+
+        # Only the first pick counts.
+        self.searches.pop(token)
+        await inter.response.defer()
+        index = int(inter.values[0])
+        search.cancel(keep=index)
+        track = await search.resolve(index, self.process_youtube_url)
+        if not track:
+            embed = await create_alert_embed("Error", "Failed to process the YouTube video.")
+            await inter.edit_original_response(embed=embed, components=[])
+            return
+        join_result = await self.join_voice_channel(inter)
+        if isinstance(join_result, disnake.Embed):
+            await inter.edit_original_response(embed=join_result, components=[])
+            return
+
+        player = self.get_player(inter.guild)
+        await player.submit(player.enqueue, [track], search.position)
+        title = "Added to Queue" if search.position is None else "Playing Next"
+        embed = await create_success_embed(title, f"🎵 {track.title} ({self.format_duration(track.duration)})")
+        await inter.edit_original_response(embed=embed, components=[])
+
     async def process_tracks(self, inter, tracks, source):
         processed_tracks = []
         total_tracks = len(tracks)
         embed = self.create_embed(f"Processing {source} Playlist", f"0/{total_tracks} tracks processed.", disnake.Color.blue(), imageless=True)
         message = await inter.edit_original_response(embed=embed)
 
-        for i, track in enumerate(tracks):
+        for start in range(0, total_tracks, PLAYLIST_BATCH):
+            if governor.degraded:
+                # Playlist ingestion can wait; extraction competes with the audio of everyone listening.
+                embed.description = f"{start}/{total_tracks} tracks processed. Paused while the host is busy, resuming in about {self.format_duration(governor.eta())}."
+                await message.edit(embed=embed)
+                await governor.wait_until_calm()
+            batch = tracks[start:start + PLAYLIST_BATCH]
             if source == "YouTube":
-                video_id = track['snippet']['resourceId']['videoId']
-                url = f"https://www.youtube.com/watch?v={video_id}"
-                processed_track = await self.process_youtube_url(url)
+                urls = [f"https://www.youtube.com/watch?v={track['snippet']['resourceId']['videoId']}" for track in batch]
             elif source == "Spotify":
-                processed_track = await self.process_spotify_track(track)
+                urls = [await self.find_spotify_track(track) for track in batch]
             else:
-                processed_track = None
+                urls = []
+            urls = [url for url in urls if url]
 
-            if processed_track:
-                processed_tracks.append(processed_track)
+            for url, info in zip(urls, await self.extract_many(urls)):
+                if info:
+                    track = Track.from_info(info, url)
+                    self.remember(track)
+                    processed_tracks.append(track)
+                else:
+                    print(f"Error processing {source} playlist entry: {url}")
 
             # Update progress
-            embed.description = f"{i + 1}/{total_tracks} tracks processed."
+            embed.description = f"{start + len(batch)}/{total_tracks} tracks processed."
             await message.edit(embed=embed)
 
         if processed_tracks:
@@ -183,153 +964,92 @@ class Music(commands.Cog):
         return processed_tracks
 
     async def process_youtube_url(self, url):
-        loop = asyncio.get_event_loop()
         try:
-            info = await loop.run_in_executor(self.executor, self._download_info, url)
+            info = await self.extract_info(url)
             if info:
-                track = {
-                    'url': info['url'],
-                    'title': info['title'],
-                    'duration': self.format_duration(info['duration']),
-                    'thumbnail': info['thumbnail']
-                }
-                print(f"Processed YouTube URL: {url} - Title: {track['title']}, Duration: {track['duration']}")
+                track = Track.from_info(info, url)
+                self.remember(track)
+                print(f"Processed YouTube URL: {url} - Title: {track.title}, Duration: {self.format_duration(track.duration)}")
                 return track
         except Exception as e:
             print(f"Error processing YouTube URL: {url} - {e}")
         return None
 
     async def process_soundcloud_url(self, url):
-        loop = asyncio.get_event_loop()
         try:
-            info = await loop.run_in_executor(self.executor, self._download_info, url)
+            info = await self.extract_info(url)
             if info:
-                track = {
-                    'url': info['url'],
-                    'title': info['title'],
-                    'duration': self.format_duration(info['duration']),
-                    'thumbnail': info['thumbnail']
-                }
-                print(f"Processed SoundCloud URL: {url} - Title: {track['title']}, Duration: {track['duration']}")
+                track = Track.from_info(info, url)
+                self.remember(track)
+                print(f"Processed SoundCloud URL: {url} - Title: {track.title}, Duration: {self.format_duration(track.duration)}")
                 return track
         except Exception as e:
             print(f"Error processing SoundCloud URL: {url} - {e}")
         return None
 
-    async def process_spotify_track(self, track):
-        if isinstance(track, tuple):
+    def remember(self, track):
+        # Known tracks only need storing once; the analysis keeps their row up to date after that.
+        if track.webpage_url in self.title_index:
+            return
+        self.track_db.update(track.webpage_url, title=track.title, duration=track.duration)
+        self.title_index.add(track.webpage_url, track.title, track.duration)
+
+    async def find_spotify_track(self, track):
+        # The YouTube URL of the top search result for a Spotify track.
+        if isinstance(track, (tuple, list)):
             title, name, duration = track
             search_query = f"{title} - {name}"
         else:
             search_query = track
         search_results = await self.search_youtube(search_query)
         if search_results:
-            url = search_results[0]['url']
-            return await self.process_youtube_url(url)
+            return search_results[0]['url']
         return None
 
-    def _download_info_with_retries(self, url, retries=3):
-        ydl_opts = {
-            'format': 'bestaudio',
-            'ignoreerrors': True,
-            'noplaylist': True,
-            'nocheckcertificate': True,
-            'quiet': True,
-            'no_warnings': True,
-            'default_search': 'auto',
-            'source_address': '0.0.0.0'
-        }
-        for attempt in range(retries):
+    async def resolve(self, op, local, **args):
+        # Goes through the shared resolver when there is one, and resolves in-process when there isn't
+        # or it can't be reached.
+        if self.resolver:
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    if 'entries' in info:
-                        info = info['entries'][0]
-                    return {
-                        'url': info['url'],
-                        'title': info['title'],
-                        'duration': info['duration'],
-                        'thumbnail': info['thumbnail']
-                    }
-            except yt_dlp.utils.DownloadError as e:
-                if '403 Forbidden' in str(e):
-                    print(f"403 Forbidden error encountered. Retrying {attempt + 1}/{retries}...")
-                    continue
-                else:
-                    print(f"Error downloading info: {url} - {e}")
-                    break
-        return None
+                return await self.resolver.request(op, **args)
+            except (OSError, RuntimeError) as e:
+                print(f"Resolver unavailable, resolving locally: {e}")
+        return await local()
+
+    async def extract_info(self, url, fresh=False):
+        # fresh skips the shared resolver's cache, for refreshes of a stream that is about to expire.
+        loop = asyncio.get_event_loop()
+        return await self.resolve('extract', lambda: loop.run_in_executor(self.executor, resolution.download_info, url), url=url, fresh=fresh)
 
-    def _download_info(self, url):
-        return self._download_info_with_retries(url)
+    async def extract_many(self, urls):
+        # One round trip to the shared resolver for the lot. Failed URLs come back as None either way.
+        if self.resolver and urls:
+            try:
+                return await self.resolver.extract_many(urls)
+            except (OSError, RuntimeError) as e:
+                print(f"Resolver unavailable, resolving locally: {e}")
+        loop = asyncio.get_event_loop()
+        infos = await asyncio.gather(
+            *(loop.run_in_executor(self.executor, resolution.download_info, url) for url in urls),
+            return_exceptions=True
+        )
+        return [None if isinstance(info, Exception) else info for info in infos]
 
     async def search_youtube(self, query):
-        search_url = "https://www.googleapis.com/youtube/v3/search"
-        params = {
-            'part': 'snippet',
-            'q': query,
-            'type': 'video',
-            'key': self.youtube_api_key,
-            'maxResults': 5
-        }
-        try:
+        async def local():
             async with aiohttp.ClientSession() as session:
-                async with session.get(search_url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        items = data['items']
-                        return [
-                            {
-                                'url': f"https://www.youtube.com/watch?v={item['id']['videoId']}",
-                                'title': item['snippet']['title'],
-                                'duration': 'Unknown'
-                            }
-                            for item in items
-                        ]
-                    else:
-                        print(f"Error searching YouTube. Status code: {response.status}")
-                        return []
-        except Exception as e:
-            print(f"Error searching YouTube: {e}")
-            return []
+                return await resolution.search_youtube(session, self.youtube_api_key, query)
+        return await self.resolve('search', local, query=query)
 
     async def get_youtube_playlist_items(self, playlist_id):
-        playlist_url = f"https://www.googleapis.com/youtube/v3/playlistItems?part=snippet&maxResults=50&playlistId={playlist_id}&key={self.youtube_api_key}"
-        try:
+        async def local():
             async with aiohttp.ClientSession() as session:
-                async with session.get(playlist_url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data['items']
-                    else:
-                        print(f"Error fetching YouTube playlist items. Status code: {response.status}")
-                        return []
-        except Exception as e:
-            print(f"Error fetching YouTube playlist items: {e}")
-            return []
+                return await resolution.get_youtube_playlist_items(session, self.youtube_api_key, playlist_id)
+        return await self.resolve('playlist', local, playlist_id=playlist_id)
 
-    async def get_spotify_tracks(self, url, retries=3):
-        if self.spotify:
-            print(f"Fetching Spotify tracks for URL: {url}")
-            for attempt in range(retries):
-                try:
-                    if '/track/' in url:
-                        track = self.spotify.track(url)
-                        print(f"Found track: {track['name']} by {track['artists'][0]['name']}")
-                        return [(track['artists'][0]['name'], track['name'], self.format_duration(track['duration_ms'] // 1000))]
-                    elif '/album/' in url:
-                        album = self.spotify.album(url)
-                        print(f"Found album: {album['name']} by {album['artists'][0]['name']}")
-                        return [(track['artists'][0]['name'], track['name'], self.format_duration(track['duration_ms'] // 1000)) for track in album['tracks']['items']]
-                    elif '/playlist/' in url:
-                        playlist = self.spotify.playlist(url)
-                        print(f"Found playlist: {playlist['name']} by {playlist['owner']['display_name']}")
-                        return [(track['track']['artists'][0]['name'], track['track']['name'], self.format_duration(track['track']['duration_ms'] // 1000)) for track in playlist['tracks']['items']]
-                except spotipy.exceptions.SpotifyException as e:
-                    print(f"Error fetching Spotify tracks: {e}. Retrying {attempt + 1}/{retries}...")
-                    await asyncio.sleep(1)  # Wait a bit before retrying
-            print("Failed to fetch Spotify tracks after retries.")
-        return []
+    async def get_spotify_tracks(self, url):
+        loop = asyncio.get_event_loop()
+        return await self.resolve('spotify', lambda: loop.run_in_executor(self.executor, resolution.get_spotify_tracks, self.spotify, url), url=url)
 
     def format_duration(self, duration_seconds):
         minutes, seconds = divmod(int(duration_seconds), 60)
@@ -339,92 +1059,220 @@ class Music(commands.Cog):
         else:
             return f"{minutes:02d}:{seconds:02d}"
 
+    def parse_duration(self, duration):
+        # Inverse of format_duration; 'Unknown' and other junk count as zero.
+        seconds = 0
+        for part in str(duration).split(':'):
+            if not part.isdigit():
+                return 0
+            seconds = seconds * 60 + int(part)
+        return seconds
+
     @commands.slash_command()
     async def play(self, inter: disnake.ApplicationCommandInteraction, query: str):
         print(f"Received play command with query: {query}")
+        await self.add_query(inter, query)
+
+    @commands.slash_command()
+    async def playnext(self, inter: disnake.ApplicationCommandInteraction, query: str):
+        """Queues a song (or playlist) to play right after the current one."""
+        print(f"Received playnext command with query: {query}")
+        await self.add_query(inter, query, position=0)
+
+    @play.autocomplete("query")
+    @playnext.autocomplete("query")
+    async def suggest_tracks(self, inter: disnake.ApplicationCommandInteraction, query: str):
+        # Answered from tracks we have resolved before, without touching the search API. A picked
+        # suggestion submits the track's page URL, so /play goes straight to it instead of searching.
+        choices = []
+        for webpage_url, title, duration in self.title_index.search(query):
+            if len(webpage_url) > 100:
+                continue
+            name = f"{title} ({self.format_duration(duration)})" if duration else title
+            if len(name) > 100:
+                name = name[:97] + "..."
+            choices.append(disnake.OptionChoice(name=name, value=webpage_url))
+        return choices
+
+    async def add_query(self, inter, query, position=None):
         await inter.response.defer()
         join_result = await self.join_voice_channel(inter)
         if isinstance(join_result, disnake.Embed):
             await inter.edit_original_response(embed=join_result)
             return
 
-        tracks = await self.handle_query(inter, query)
+        # Resolving can take a while; only the queue change goes through the player. A search only shows its
+        # menu here, and the pick is queued by on_dropdown.
+        tracks = await self.handle_query(inter, query, position)
         if tracks:
-            for track in tracks:
-                self.song_queue.append(track)
-            if not self.is_playing:
-                await self.play_next()
-            await self.update_dashboard()
-            embed = await create_success_embed("Added to Queue", f"Added {len(tracks)} track(s) to the queue.")
+            player = self.get_player(inter.guild)
+            await player.submit(player.enqueue, tracks, position)
+            if position is None:
+                embed = await create_success_embed("Added to Queue", f"Added {len(tracks)} track(s) to the queue.")
+            else:
+                embed = await create_success_embed("Playing Next", f"Added {len(tracks)} track(s) to the front of the queue.")
             await inter.edit_original_response(embed=embed)
 
-    async def play_next(self):
-        if self.repeat and self.current_song:
-            # If repeat is enabled, re-play the current song
-            await self.play_song(self.current_song)
-        else:
-            if not self.song_queue:
-                self.current_song = None
-                self.is_playing = False
-                await self.update_dashboard()
-                await update_status(self)
+    def load_analysis(self, song, guild_id=None):
+        # Fills in loudness and trim offsets from the track database. Unknown tracks are
+        # analysed in the background; later plays get the stored values for free.
+        if song.analysed:
+            return
+        stored = self.track_db.get(song.webpage_url)
+        if stored and stored['trim_end'] is not None:
+            song.apply_analysis(stored)
+        elif song.webpage_url not in self.pending_analyses:
+            self.pending_analyses.add(song.webpage_url)
+            self.bot.loop.create_task(self.analyse_track(song, guild_id))
+
+    async def analyse_track(self, song, guild_id=None):
+        try:
+            await governor.wait_until_calm()
+            if not song.url:
+                # Its stream was released; it is analysed again once it is near the head of a queue.
                 return
+            async with self.analysis_semaphore:
+                analysis = await analyse_stream(song.url, guild_id=guild_id)
+            if analysis:
+                song.apply_analysis(analysis)
+                self.track_db.update(song.webpage_url, title=song.title, duration=song.duration, **analysis)
+                loudness = f"{analysis['loudness']:.1f} LUFS" if analysis['loudness'] is not None else "silent"
+                print(f"Analysed {song.title}: {loudness}, audio from {analysis['trim_start']:.1f}s to {analysis['trim_end']:.1f}s")
+        except Exception as e:
+            print(f"Error analysing {song.title}: {e}")
+        finally:
+            self.pending_analyses.discard(song.webpage_url)
 
-            self.current_song = self.song_queue.popleft()
-            self.is_playing = True
-            await self.play_song(self.current_song)
-            await self.update_dashboard()
-            await update_status(self)
+    @commands.slash_command()
+    async def crossfade(self, inter: disnake.ApplicationCommandInteraction, seconds: commands.Range[int, 0, 12]):
+        """Blends the end of each song into the next one. 0 turns it off."""
+        await inter.response.defer(ephemeral=True)
+        player = self.get_player(inter.guild)
+        await player.submit(player.set_crossfade, seconds)
+        if seconds:
+            embed = await create_success_embed("Crossfade On", f"Songs will blend over {seconds} seconds, starting with the next one.")
+        else:
+            embed = await create_success_embed("Crossfade Off", "Songs will play back to back.")
+        await inter.edit_original_response(embed=embed)
 
-    async def play_song(self, song):
-        voice_client = self.bot.voice_clients[0]
-        if voice_client.is_playing():
-            voice_client.stop()
-        ffmpeg_options = {
-            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-            'options': '-vn -buffer_size 16M'
-        }
-        audio_source = await disnake.FFmpegOpusAudio.from_probe(song['url'], **ffmpeg_options)
-        
-        voice_client.play(audio_source)
-        self.is_playing = True  # Ensure the bot knows it's playing
-        await update_status(self)  # Update the bot's status
+    @commands.slash_command()
+    async def seek(self, inter: disnake.ApplicationCommandInteraction, position: str):
+        """Jumps to a position in the current song, e.g. 1:23 or 83."""
+        player = self.get_player(inter.guild)
+        if not player.current_song or not player.current_source or not inter.guild.voice_client:
+            embed = await create_alert_embed("Nothing to Seek", "There's nothing currently playing.")
+            await inter.response.send_message(embed=embed, ephemeral=True)
+            return
 
-    
+        seconds = self.parse_duration(position)
+        duration = track_duration(player.current_song)
+        if duration and seconds >= duration:
+            embed = await create_alert_embed("Invalid Position", f"The current song is only {self.format_duration(duration)} long.")
+            await inter.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        await inter.response.defer(ephemeral=True)
+        if await player.submit(player.seek, seconds):
+            await inter.edit_original_response(embed=await create_success_embed("Seeked", f"Now playing from {self.format_duration(seconds)}."))
+        else:
+            await inter.edit_original_response(embed=await create_alert_embed("Nothing to Seek", "There's nothing currently playing."))
 
     @commands.slash_command()
     async def skip(self, inter):
-        if inter.guild.voice_client and inter.guild.voice_client.is_playing():
-            inter.guild.voice_client.stop()
-            await self.play_next()
-            await inter.response.send_message(embed=await create_success_embed("Skipped the current song."), ephemeral=True)  # Acknowledge the interaction
+        # Acknowledge the interaction first; the player may be busy starting a song for a while.
+        await inter.response.defer(ephemeral=True)
+        player = self.get_player(inter.guild)
+        if await player.submit(player.skip):
+            await inter.edit_original_response(embed=await create_success_embed("Skipped the current song."))
         else:
             embed = await create_alert_embed("Nothing to Skip", "There's nothing currently playing to skip.")
-            await inter.response.send_message(embed=embed, ephemeral=True)
+            await inter.edit_original_response(embed=embed)
+
+    @commands.slash_command()
+    async def remove(self, inter: disnake.ApplicationCommandInteraction, position: commands.Range[int, 1, ...]):
+        """Removes a song from the queue, by its number in /queue."""
+        await inter.response.defer(ephemeral=True)
+        player = self.get_player(inter.guild)
+        track = await player.submit(player.remove, position - 1)
+        if track:
+            embed = await create_success_embed("Removed", f"Removed {track.title} from the queue.")
+        else:
+            embed = await create_alert_embed("Invalid Position", f"There are only {len(player.song_queue)} songs in the queue.")
+        await inter.edit_original_response(embed=embed)
+
+    @commands.slash_command()
+    async def move(self, inter: disnake.ApplicationCommandInteraction, position: commands.Range[int, 1, ...], to: commands.Range[int, 1, ...]):
+        """Moves a song to another place in the queue, by their numbers in /queue."""
+        await inter.response.defer(ephemeral=True)
+        player = self.get_player(inter.guild)
+        track = await player.submit(player.move, position - 1, to - 1)
+        if track:
+            embed = await create_success_embed("Moved", f"{track.title} is now number {to} in the queue.")
+        else:
+            embed = await create_alert_embed("Invalid Position", f"There are only {len(player.song_queue)} songs in the queue.")
+        await inter.edit_original_response(embed=embed)
+
+    @commands.slash_command()
+    async def shuffle(self, inter: disnake.ApplicationCommandInteraction):
+        """Shuffles the queue."""
+        await inter.response.defer(ephemeral=True)
+        player = self.get_player(inter.guild)
+        if await player.submit(player.shuffle):
+            embed = await create_success_embed("Shuffled", f"Shuffled {len(player.song_queue)} songs.")
+        else:
+            embed = await create_alert_embed("Nothing to Shuffle", "There are fewer than two songs in the queue.")
+        await inter.edit_original_response(embed=embed)
+
+    @commands.slash_command()
+    async def dedupe(self, inter: disnake.ApplicationCommandInteraction):
+        """Removes songs that are already further up the queue."""
+        await inter.response.defer(ephemeral=True)
+        player = self.get_player(inter.guild)
+        removed = await player.submit(player.dedupe)
+        if removed:
+            embed = await create_success_embed("Removed Duplicates", f"Removed {removed} duplicate song(s) from the queue.")
+        else:
+            embed = await create_success_embed("No Duplicates", "Every song in the queue is only in it once.")
+        await inter.edit_original_response(embed=embed)
+
+    @commands.slash_command()
+    async def clear(self, inter: disnake.ApplicationCommandInteraction):
+        """Empties the queue. The current song keeps playing."""
+        await inter.response.defer(ephemeral=True)
+        player = self.get_player(inter.guild)
+        count = await player.submit(player.clear_queue)
+        embed = await create_success_embed("Queue Cleared", f"Removed {count} song(s) from the queue.")
+        await inter.edit_original_response(embed=embed)
 
     @commands.slash_command()
     async def queue(self, inter):
         await self.show_queue(inter, ephemeral=False)
 
     async def show_queue(self, inter, page=1, ephemeral=False, followup=False, response=True):
+        player = self.get_player(inter.guild)
         items_per_page = 10
         start_index = (page - 1) * items_per_page
         end_index = start_index + items_per_page
         
-        queue_items = list(self.song_queue)[start_index:end_index]
+        queue_items = player.song_queue.slice(start_index, end_index)
         embed = self.create_embed("Music Queue", "", disnake.Color.blue(), imageless=True)
         
-        if self.current_song:
-            embed.add_field(name="Now Playing", value=f"🎵 {self.current_song['title']} ({self.current_song['duration']})", inline=False)
+        if player.current_song:
+            embed.add_field(name="Now Playing", value=f"🎵 {player.current_song.title} ({self.format_duration(player.current_song.duration)})", inline=False)
         
         if not queue_items:
             embed.description = "The queue is empty."
         else:
-            queue_text = "\n".join(f"`{i+1}.` {song['title']} ({song['duration']})" for i, song in enumerate(queue_items, start=start_index))
-            embed.add_field(name="Upcoming Songs", value=queue_text, inline=False)
+            # One prefix-sum lookup for the page, then add up the songs on it.
+            eta = player.eta(start_index)
+            lines = []
+            for i, song in enumerate(queue_items, start=start_index):
+                lines.append(f"`{i+1}.` {song.title} ({self.format_duration(song.duration)}), in {self.format_duration(eta)}")
+                eta += track_duration(song)
+            embed.add_field(name="Upcoming Songs", value="\n".join(lines), inline=False)
         
-        total_pages = (len(self.song_queue) + items_per_page - 1) // items_per_page
-        embed.set_footer(text=f"Page {page}/{total_pages}")
+        total_pages = (len(player.song_queue) + items_per_page - 1) // items_per_page
+        embed.set_footer(text=f"Page {page}/{total_pages} · {self.format_duration(player.total_remaining())} left in total")
         embed.set_author(name="WACA-Chan", icon_url=self.bot.user.avatar.url)
         
         view = QueuePaginationView(self, inter, page, total_pages)
@@ -437,64 +1285,25 @@ class Music(commands.Cog):
 
     @commands.slash_command()
     async def dashboard(self, inter):
-        embed = self.create_dashboard_embed()
-        components = self.create_dashboard_components()
+        player = self.get_player(inter.guild)
+        embed = player.create_dashboard_embed()
+        components = player.create_dashboard_components()
         message = await inter.response.send_message(embed=embed, components=components)
-        self.dashboard_message = await inter.original_message()
-        self.dashboard_channel = inter.channel
+        player.dashboard_message = await inter.original_message()
+        player.dashboard_channel = inter.channel
 
-    def create_embed(self, title, description, color, imageless=False):
+    def create_embed(self, title, description, color, imageless=False, song=None):
         embed = disnake.Embed(title=title, description=description, color=color, timestamp=disnake.utils.utcnow())
         embed.set_footer(text=f"WACA-Chan 1.2", icon_url=self.bot.user.avatar.url)
         
         if not imageless:
-            if self.current_song and 'thumbnail' in self.current_song:
-                embed.set_image(url=self.current_song['thumbnail'])
+            if song and song.thumbnail:
+                embed.set_image(url=song.thumbnail)
             else:
                 embed.set_image(url="https://cdn.discordapp.com/attachments/913207064136925254/1262876163962044456/Something_new.png?ex=66983094&is=6696df14&hm=beebf7e3450d353dd58fea1981d8a566fc3d3f32a5f4a106b06c7764bdb4c65c&")
         
         return embed
 
-    def create_dashboard_embed(self):
-        embed = self.create_embed("Music Dashboard", "", disnake.Color.blue())
-        if self.current_song:
-            embed.add_field(name="Now Playing", value=f"🎵 {self.current_song['title']} ({self.current_song['duration']})", inline=False)
-        else:
-            embed.add_field(name="Now Playing", value="Nothing is currently playing", inline=False)
-        embed.add_field(name="Volume", value=f"{int(self.volume * 100)}%", inline=True)
-        embed.add_field(name="Repeat", value="On" if self.repeat else "Off", inline=True)
-        embed.set_thumbnail(url=self.bot.user.avatar.url)
-        return embed
-
-    def create_dashboard_components(self):
-        play_pause_style = disnake.ButtonStyle.secondary if self.is_playing else disnake.ButtonStyle.success
-        play_pause_emoji = "<:Pause:1262673070854901770>" if self.is_playing else "<:Play:1262672920984027157>"
-        repeat_style = disnake.ButtonStyle.secondary if self.repeat else disnake.ButtonStyle.primary
-        return [
-            disnake.ui.Button(style=disnake.ButtonStyle.primary, emoji="<:VolDown:1262671144910061650>", custom_id="music_volume_down"),
-            disnake.ui.Button(style=disnake.ButtonStyle.primary, emoji="<:PreviousTrack:1262671148525682760>", custom_id="music_previous"),
-            disnake.ui.Button(style=play_pause_style, emoji=play_pause_emoji, custom_id="music_play_pause"),
-            
-            disnake.ui.Button(style=disnake.ButtonStyle.primary, emoji="<:NextTrack:1262671150291353625>", custom_id="music_skip"),
-            disnake.ui.Button(style=disnake.ButtonStyle.primary, emoji="<:VolUp:1262671143890976798>", custom_id="music_volume_up"),
-            disnake.ui.Button(style=disnake.ButtonStyle.secondary,label="-", disabled=True, custom_id="button_disabled2"),
-            disnake.ui.Button(style=repeat_style, emoji="<:RepeatOne:1262671948140384298>", custom_id="music_repeat"),
-            disnake.ui.Button(style=disnake.ButtonStyle.success, emoji="<:AddToList:1262671146491445249>", custom_id="music_add_to_playlist"),
-            disnake.ui.Button(style=disnake.ButtonStyle.primary, emoji="<:Queue:1262673071626522644>", custom_id="music_view_queue"),
-            disnake.ui.Button(style=disnake.ButtonStyle.secondary,label="-", disabled=True, custom_id="button_disabled")
-        ]
-
-    async def update_dashboard(self):
-        if self.dashboard_message and self.dashboard_channel:
-            embed = self.create_dashboard_embed()
-            components = self.create_dashboard_components()
-            try:
-                await self.dashboard_message.edit(embed=embed, components=components)
-            except disnake.NotFound:
-                # If the message was deleted, reset the dashboard
-                self.dashboard_message = None
-                self.dashboard_channel = None
-
     @commands.Cog.listener()
     async def on_button_click(self, inter: disnake.MessageInteraction):
         if inter.component.custom_id.startswith("queue_"):
@@ -529,38 +1338,28 @@ class Music(commands.Cog):
             else:
                 await inter.response.defer(ephemeral=True)
 
+            player = self.get_player(inter.guild)
             if inter.component.custom_id == "music_previous":
-                await inter.response.send_message(embed=await create_alert_embed("This feature is not available yet."), ephemeral=True)
+                if not await player.submit(player.previous):
+                    embed = await create_alert_embed("Nothing to Go Back To", "No songs have finished playing yet.")
+                    await inter.followup.send(embed=embed, ephemeral=True)
             elif inter.component.custom_id == "music_play_pause":
-                if inter.guild.voice_client:
-                    if inter.guild.voice_client.is_playing():
-                        inter.guild.voice_client.pause()
-                        self.is_playing = False
-                    else:
-                        inter.guild.voice_client.resume()
-                        self.is_playing = True
+                await player.submit(player.toggle_pause)
             elif inter.component.custom_id == "music_skip":
-                if inter.guild.voice_client and inter.guild.voice_client.is_playing():
-                    inter.guild.voice_client.stop()
-                    await self.play_next()
-                else:
+                if not await player.submit(player.skip):
                     embed = await create_alert_embed("Nothing to Skip", "There's nothing currently playing to skip.")
                     await inter.followup.send(embed=embed, ephemeral=True)
             elif inter.component.custom_id == "music_volume_up":
-                self.volume = round(min(2.0, self.volume + 0.1), 1)
-                if inter.guild.voice_client and inter.guild.voice_client.source:
-                    inter.guild.voice_client.source.volume = self.volume
+                await player.submit(player.change_volume, 0.1)
             elif inter.component.custom_id == "music_volume_down":
-                self.volume = round(max(0.0, self.volume - 0.1), 1)
-                if inter.guild.voice_client and inter.guild.voice_client.source:
-                    inter.guild.voice_client.source.volume = self.volume
+                await player.submit(player.change_volume, -0.1)
             elif inter.component.custom_id == "music_repeat":
-                self.repeat = not self.repeat
+                await player.submit(player.toggle_repeat)
             elif inter.component.custom_id == "music_view_queue":
                 await self.show_queue(inter, ephemeral=True, followup=True, response=False)
 
-            await self.update_dashboard()
-            await inter.edit_original_response(embed=self.create_dashboard_embed(), components=self.create_dashboard_components())
+            await player.submit(player.update_dashboard)
+            await inter.edit_original_response(embed=player.create_dashboard_embed(), components=player.create_dashboard_components())
         
 
     @commands.Cog.listener()
@@ -576,42 +1375,63 @@ class Music(commands.Cog):
     @commands.slash_command()
     async def debug(self, inter: disnake.ApplicationCommandInteraction):
         """Displays debug information about the music client."""
+        player = self.get_player(inter.guild)
         embed = disnake.Embed(title="Music Client Debug Info", color=disnake.Color.green())
         
-        if self.current_song:
-            embed.add_field(name="Now Playing", value=f"{self.current_song['title']} ({self.current_song['duration']})", inline=False)
+        if player.current_song:
+            embed.add_field(name="Now Playing", value=f"{player.current_song.title} ({self.format_duration(player.current_song.duration)})", inline=False)
         else:
             embed.add_field(name="Now Playing", value="Nothing is currently playing", inline=False)
         
-        embed.add_field(name="Is Playing", value=str(self.is_playing), inline=True)
-        embed.add_field(name="Volume", value=f"{int(self.volume * 100)}%", inline=True)
-        embed.add_field(name="Repeat", value="On" if self.repeat else "Off", inline=True)
-        embed.add_field(name="Queue Length", value=str(len(self.song_queue)), inline=True)
+        embed.add_field(name="Is Playing", value=str(player.is_playing), inline=True)
+        embed.add_field(name="Volume", value=f"{int(player.volume * 100)}%", inline=True)
+        embed.add_field(name="Repeat", value=player.repeat_mode(), inline=True)
+        embed.add_field(name="Queue Length", value=f"{len(player.song_queue)} ({player.song_queue.spilled} on disk)", inline=True)
+        if player.current_source:
+            embed.add_field(name="Position", value=self.format_duration(player.current_source.position), inline=True)
+        embed.add_field(name="Players", value=f"{len(self.players)} active, {player.mailbox.processed} commands handled here, {player.mailbox.queue.qsize()} waiting", inline=True)
+        embed.add_field(name="Open Searches", value=str(len(self.searches)), inline=True)
+        children = supervisor.sample()
+        lines = [
+            f"PID {child.process.pid} {child.kind} (guild {child.guild_id or '?'}): "
+            f"{child.cpu:.1f}% CPU, {child.rss / 1048576:.1f} MB, {self.format_duration(time.monotonic() - child.started)}"
+            for child in children[:10]
+        ]
+        lines.append(f"{len(children)}/{supervisor.limit} running, {supervisor.reaped} reaped, {supervisor.rejected} rejected")
+        embed.add_field(name="FFmpeg Processes", value="\n".join(lines), inline=False)
+        shared_streams, listeners = broadcasts.stats()
+        embed.add_field(name="Shared Streams", value=f"{shared_streams} feeding {listeners} player(s)", inline=True)
+        embed.add_field(name="Stream Recoveries", value=str(player.recoveries), inline=True)
+        if self.resolver:
+            try:
+                stats = await self.resolver.request('stats')
+                resolver = f"{stats['hits']} hits, {stats['misses']} misses, {stats['coalesced']} coalesced, {stats['cached']} cached"
+            except (OSError, RuntimeError) as e:
+                resolver = f"Unavailable ({e})"
+            embed.add_field(name="Shared Resolver", value=resolver, inline=True)
+        if getattr(self.bot, 'shards', None):
+            embed.add_field(name="Shards", value=f"{', '.join(map(str, self.bot.shards))} of {self.bot.shard_count}", inline=True)
+        if player.loop_queue or player.loops:
+            per_loop = ", ".join(map(str, player.loop_refreshes)) or "none yet"
+            embed.add_field(name="Queue Loops", value=f"{player.loops} completed, re-resolutions per loop: {per_loop}, {player.refreshes - player.loop_mark} this loop", inline=False)
+        if player.last_recovery:
+            embed.add_field(name="Last Recovery", value=player.last_recovery, inline=False)
         
-        if self.bot.voice_clients:
-            voice_client = self.bot.voice_clients[0]
+        if inter.guild.voice_client:
+            voice_client = inter.guild.voice_client
             embed.add_field(name="Connected to Voice Channel", value=str(voice_client.channel), inline=False)
+            embed.add_field(name="Encoding", value=f"{encoding.bitrate_for(voice_client.channel)} kbps, complexity {encoding.complexity}", inline=True)
+            embed.add_field(name="Host Load", value=governor.describe() + (" (degraded)" if governor.degraded else ""), inline=True)
         else:
             embed.add_field(name="Connected to Voice Channel", value="Not connected", inline=False)
         
         await inter.response.send_message(embed=embed)
 
-class SongChoiceView(disnake.ui.View):
-    def __init__(self, cog, search_results, author_id):
-        super().__init__(timeout=60.0)
-        self.cog = cog
-        self.search_results = search_results
-        self.author_id = author_id
-        self.selected_song = None
-        self.add_item(SongChoiceSelect(cog, search_results, author_id))
-
 class SongChoiceSelect(disnake.ui.Select):
-    def __init__(self, cog, search_results, author_id):
-        self.cog = cog
-        self.search_results = search_results
-        self.author_id = author_id
+    # Holds no state itself: the pick is handled by Music.on_dropdown, which finds the search by the token in custom_id.
+    def __init__(self, search_results, token):
         options = []
-        for i, result in enumerate(self.search_results):
+        for i, result in enumerate(search_results):
             label = result['title']
             if len(label) > 100:
                 label = label[:97] + "..."
@@ -622,30 +1442,7 @@ class SongChoiceSelect(disnake.ui.Select):
                     value=str(i)
                 )
             )
-        super().__init__(placeholder="Choose a song", options=options, custom_id="song_select")
-
-    async def callback(self, inter: disnake.MessageInteraction):
-        if inter.author.id != self.author_id:
-            await inter.response.send_message("You didn't initiate this search.", ephemeral=True)
-            return
-
-        await inter.response.defer()
-        selected_index = int(self.values[0])
-        selected_song = self.search_results[selected_index]
-        self.cog.selected_song = selected_song
-        url = selected_song['url']
-        title = selected_song['title']
-        duration = selected_song['duration']
-        
-        processed_track = await self.cog.process_youtube_url(url)
-        if processed_track:
-            self.cog.song_queue.append(processed_track)  # Append the processed track dictionary
-            embed = await create_success_embed("Added to Queue", f"🎵 {processed_track['title']} ({processed_track['duration']})")
-            await inter.edit_original_response(embed=embed, view=None)
-
-            if not self.cog.is_playing:
-                await self.cog.play_next()
-            await self.cog.update_dashboard()
+        super().__init__(placeholder="Choose a song", options=options, custom_id=f"search_{token}")
 
 class QueuePaginationView(disnake.ui.View):
     def __init__(self, cog, inter, current_page, total_pages):